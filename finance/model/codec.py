@@ -0,0 +1,152 @@
+import bz2
+import gzip
+import json
+import lzma
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class UnsupportedFormatError(Exception):
+    pass
+
+
+class JsonFormat:
+    """
+    Pretty-printed JSON. Uses orjson when it is installed, which only indents by 2, so the json module does as well
+    and a budget is written the same either way.
+    """
+
+    def dumps(self, data: dict) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, raw: bytes) -> dict:
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw.decode("utf-8"))
+
+
+class MsgpackFormat:
+    """
+    Compact binary format. Requires msgpack to be installed.
+    """
+
+    def dumps(self, data: dict) -> bytes:
+        return self._msgpack().packb(data, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> dict:
+        return self._msgpack().unpackb(raw, raw=False)
+
+    @staticmethod
+    def _msgpack():
+        if msgpack is None:
+            raise UnsupportedFormatError("The msgpack format requires the msgpack package to be installed")
+        return msgpack
+
+
+def _zstandard():
+    if zstandard is None:
+        raise UnsupportedFormatError("The .zst compression requires the zstandard package to be installed")
+    return zstandard
+
+
+FORMATS = {
+    ".json": JsonFormat(),
+    ".msgpack": MsgpackFormat()
+}
+
+COMPRESSIONS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    ".gz": (gzip.compress, gzip.decompress),
+    ".bz2": (bz2.compress, bz2.decompress),
+    ".xz": (lzma.compress, lzma.decompress),
+    ".zst": (
+        lambda raw: _zstandard().ZstdCompressor().compress(raw),
+        lambda raw: _zstandard().ZstdDecompressor().decompress(raw)
+    )
+}
+
+
+class Codec:
+    """
+    Converts between budget dicts (see `Budget.to_dict`) and bytes using a format and optionally a compression.
+    """
+
+    def __init__(self, extension: str = ".json", compression: Optional[str] = None):
+        if extension not in FORMATS:
+            raise UnsupportedFormatError(f"Unknown budget format {extension}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise UnsupportedFormatError(f"Unknown compression {compression}")
+        self.extension = extension
+        self.compression = compression
+        self._format = FORMATS[extension]
+
+    @property
+    def suffix(self) -> str:
+        return self.extension + (self.compression or "")
+
+    def dumps(self, data: dict) -> bytes:
+        raw = self._format.dumps(data)
+        if self.compression is not None:
+            raw = COMPRESSIONS[self.compression][0](raw)
+        return raw
+
+    def loads(self, raw: bytes) -> dict:
+        if self.compression is not None:
+            raw = COMPRESSIONS[self.compression][1](raw)
+        return self._format.loads(raw)
+
+    def read(self, path: str | Path) -> dict:
+        with open(path, "rb") as f:
+            return self.loads(f.read())
+
+    def write(self, path: str | Path, data: dict):
+        # Write to a temporary file first, so a failing save never leaves a truncated budget behind. Its name is
+        # unique, as other processes can write the same file at the same time.
+        path = Path(path)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.dumps(data))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def split_suffix(path: str | Path) -> Tuple[str, Optional[str]]:
+    """
+    Returns the format extension and compression of a path, e.g. (".json", ".gz") for "budget.json.gz".
+    """
+    suffixes = [x.lower() for x in Path(path).suffixes]
+    compression = suffixes.pop() if suffixes and suffixes[-1] in COMPRESSIONS else None
+    return (suffixes[-1] if suffixes else ""), compression
+
+
+def codec_for(path: str | Path) -> Codec:
+    """
+    The codec to use for a file, chosen by its extension.
+    """
+    return Codec(*split_suffix(path))
+
+
+def is_budget_file(path: str | Path) -> bool:
+    extension, _ = split_suffix(path)
+    return extension in FORMATS
@@ -0,0 +1,403 @@
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from finance.model.codec import is_budget_file
+from finance.model.entry import Budget, Entry, EntryGroup, Transfer, Account
+
+_COLUMN_TYPES = {str: "TEXT", float: "REAL", int: "INTEGER"}
+
+
+def _columns(cls) -> Tuple[str, ...]:
+    return tuple(x.name for x in dataclasses.fields(cls) if x.name != "id")
+
+
+def _column_definitions(cls) -> str:
+    return ",\n    ".join(f"{x.name} {_COLUMN_TYPES.get(x.type, 'TEXT')}" for x in dataclasses.fields(cls) if x.name != "id")
+
+
+ENTRY_COLUMNS = _columns(Entry)
+TRANSFER_COLUMNS = _columns(Transfer)
+ACCOUNT_COLUMNS = _columns(Account)
+
+GROUP_COLUMNS = ("kind", "name")
+
+# The table and the columns of the rows of each kind of object
+_TABLES = {
+    EntryGroup: ("entry_groups", ("name",)),
+    Entry: ("entries", ENTRY_COLUMNS),
+    Transfer: ("transfers", TRANSFER_COLUMNS),
+    Account: ("accounts", ACCOUNT_COLUMNS)
+}
+
+# The kinds of groups, by the name of their list on the budget
+GROUP_KINDS = ("expenses", "incomes")
+
+# Copies of a budget share the ids of its groups, entries, transfers and accounts, so ids are only unique within a
+# budget
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS budgets (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    budget_accounts TEXT NOT NULL,
+    extra TEXT NOT NULL,
+    modified REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_groups (
+    budget_id TEXT NOT NULL REFERENCES budgets(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    PRIMARY KEY (budget_id, id)
+);
+CREATE INDEX IF NOT EXISTS entry_groups_position ON entry_groups(budget_id, kind, position);
+CREATE TABLE IF NOT EXISTS entries (
+    budget_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    {_column_definitions(Entry)},
+    PRIMARY KEY (budget_id, id),
+    FOREIGN KEY (budget_id, group_id) REFERENCES entry_groups(budget_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS entries_position ON entries(budget_id, group_id, position);
+CREATE INDEX IF NOT EXISTS entries_account ON entries(account);
+CREATE TABLE IF NOT EXISTS transfers (
+    budget_id TEXT NOT NULL REFERENCES budgets(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    {_column_definitions(Transfer)},
+    PRIMARY KEY (budget_id, id)
+);
+CREATE INDEX IF NOT EXISTS transfers_position ON transfers(budget_id, position);
+CREATE INDEX IF NOT EXISTS transfers_source ON transfers(source);
+CREATE INDEX IF NOT EXISTS transfers_destination ON transfers(destination);
+CREATE TABLE IF NOT EXISTS accounts (
+    budget_id TEXT NOT NULL REFERENCES budgets(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    {_column_definitions(Account)},
+    PRIMARY KEY (budget_id, id)
+);
+CREATE INDEX IF NOT EXISTS accounts_position ON accounts(budget_id, position);
+CREATE INDEX IF NOT EXISTS accounts_name ON accounts(name);
+"""
+
+
+def _value(value):
+    # Account types are stored by their value, lists and dicts as JSON
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _row(data: dict, columns: Tuple[str, ...]) -> tuple:
+    return tuple(_value(data[x]) for x in columns)
+
+
+class BudgetDatabase:
+    """
+    Budgets stored in normalized tables of a SQLite database: one row per budget, group, entry, transfer and account,
+    ordered within their parent by a position.
+
+    When a budget is attached, each change to it is written as it happens as a small transaction which only touches
+    the rows of the changed objects, so there is nothing left to write when it is saved. The database is in WAL mode,
+    so reads are not blocked by writes.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        # The connection is shared by the threads of the web server, which take turns through the lock
+        self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        # The listener of each attached budget, by budget id
+        self._listeners = {}
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+    def list_budgets(self) -> List[sqlite3.Row]:
+        """
+        The id, name and modification time of each budget.
+        """
+        with self._lock:
+            return self.connection.execute("SELECT id, name, modified FROM budgets ORDER BY rowid").fetchall()
+
+    def __contains__(self, idx: str) -> bool:
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM budgets WHERE id = ?", (idx,)).fetchone() is not None
+
+    def read(self, idx: str) -> dict:
+        """
+        The budget with the given id, as returned by `Budget.to_dict`. Raises KeyError if there is no such budget.
+        """
+        with self._lock:
+            c = self.connection
+            budget = c.execute("SELECT * FROM budgets WHERE id = ?", (idx,)).fetchone()
+            if budget is None:
+                raise KeyError(idx)
+
+            groups = {x: [] for x in GROUP_KINDS}
+            entries: Dict[str, list] = {}
+            for row in c.execute(
+                    "SELECT id, kind, name FROM entry_groups WHERE budget_id = ? ORDER BY position", (idx,)):
+                grp = {"name": row["name"], "entries": [], "id": row["id"]}
+                groups[row["kind"]].append(grp)
+                entries[row["id"]] = grp["entries"]
+            for row in c.execute(
+                    f"SELECT group_id, id, {', '.join(ENTRY_COLUMNS)} FROM entries WHERE budget_id = ? "
+                    f"ORDER BY group_id, position", (idx,)):
+                entries[row["group_id"]].append({**{x: row[x] for x in ENTRY_COLUMNS}, "id": row["id"]})
+
+            def rows(table, columns):
+                return [
+                    {**{x: row[x] for x in columns}, "id": row["id"]} for row in c.execute(
+                        f"SELECT id, {', '.join(columns)} FROM {table} WHERE budget_id = ? ORDER BY position", (idx,))
+                ]
+
+            return {
+                "name": budget["name"],
+                "expenses": groups["expenses"],
+                "incomes": groups["incomes"],
+                "transfers": rows("transfers", TRANSFER_COLUMNS),
+                "budget_accounts": json.loads(budget["budget_accounts"]),
+                "accounts": rows("accounts", ACCOUNT_COLUMNS),
+                "id": budget["id"],
+                "extra": json.loads(budget["extra"])
+            }
+
+    def write(self, data: dict):
+        """
+        Writes the whole budget, as returned by `Budget.to_dict`, replacing what is stored for it.
+        """
+        idx = data["id"]
+        with self.transaction() as c:
+            c.execute(
+                "INSERT INTO budgets (id, name, budget_accounts, extra, modified) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, budget_accounts = excluded.budget_accounts, "
+                "extra = excluded.extra, modified = excluded.modified",
+                (idx, data["name"], _value(data["budget_accounts"]), _value(data.get("extra", {})), time.time())
+            )
+            for table in ("entry_groups", "transfers", "accounts"):
+                c.execute(f"DELETE FROM {table} WHERE budget_id = ?", (idx,))
+
+            groups, entries = [], []
+            for kind in GROUP_KINDS:
+                for position, grp in enumerate(data[kind]):
+                    groups.append((idx, grp["id"], position, kind, grp["name"]))
+                    entries += [
+                        (idx, x["id"], grp["id"], n) + _row(x, ENTRY_COLUMNS) for n, x in enumerate(grp["entries"])
+                    ]
+            c.executemany(_insert("entry_groups", GROUP_COLUMNS), groups)
+            c.executemany(_insert("entries", ENTRY_COLUMNS, "group_id"), entries)
+            for key, columns in (("transfers", TRANSFER_COLUMNS), ("accounts", ACCOUNT_COLUMNS)):
+                c.executemany(
+                    _insert(key, columns), [(idx, x["id"], n) + _row(x, columns) for n, x in enumerate(data[key])]
+                )
+
+    def delete(self, idx: str):
+        self.detach(idx)
+        with self.transaction() as c:
+            c.execute("DELETE FROM budgets WHERE id = ?", (idx,))
+
+    def budgets_referring_to(self, account: str) -> List[str]:
+        """
+        The ids of the budgets with entries or transfers on the account with the given name.
+        """
+        with self._lock:
+            return [row[0] for row in self.connection.execute(
+                "SELECT budget_id FROM entries WHERE account = ? "
+                "UNION SELECT budget_id FROM transfers WHERE source = ? OR destination = ?",
+                (account, account, account)
+            )]
+
+    def attach(self, budget: Budget):
+        """
+        Writes the changes to the budget to the database as they happen.
+        """
+        def on_change(op, obj, name, value):
+            self._on_change(budget.id, op, obj, name, value)
+
+        self.detach(budget.id)
+        self._listeners[budget.id] = (budget, on_change)
+        budget.register_on_change(on_change)
+
+    def detach(self, idx: str):
+        budget, on_change = self._listeners.pop(idx, (None, None))
+        if budget is not None:
+            budget.unregister_on_change(on_change)
+
+    def _on_change(self, budget_id: str, op: str, obj, name: str, value):
+        with self.transaction() as c:
+            if op == "set":
+                if isinstance(obj, Budget):
+                    if name in ("name", "budget_accounts", "extra"):
+                        c.execute(f"UPDATE budgets SET {name} = ? WHERE id = ?", (_value(value), budget_id))
+                else:
+                    table, columns = _TABLES[type(obj)]
+                    if name in columns:
+                        c.execute(
+                            f"UPDATE {table} SET {name} = ? WHERE budget_id = ? AND id = ?",
+                            (_value(value), budget_id, obj.id)
+                        )
+            elif op == "add":
+                if isinstance(value, Entry):
+                    position = _next_position(c, "entries", budget_id, "group_id = ?", obj.id)
+                    c.execute(
+                        _insert("entries", ENTRY_COLUMNS, "group_id"),
+                        (budget_id, value.id, obj.id, position) + _row(_asdict(value), ENTRY_COLUMNS)
+                    )
+                elif isinstance(value, EntryGroup):
+                    position = _next_position(c, "entry_groups", budget_id, "kind = ?", name)
+                    c.execute(_insert("entry_groups", GROUP_COLUMNS), (budget_id, value.id, position, name, value.name))
+                    c.execute("DELETE FROM entries WHERE budget_id = ? AND group_id = ?", (budget_id, value.id))
+                    c.executemany(
+                        _insert("entries", ENTRY_COLUMNS, "group_id"),
+                        [(budget_id, x.id, value.id, n) + _row(_asdict(x), ENTRY_COLUMNS)
+                         for n, x in enumerate(value.entries)]
+                    )
+                else:
+                    table, columns = _TABLES[type(value)]
+                    position = _next_position(c, table, budget_id)
+                    c.execute(_insert(table, columns), (budget_id, value.id, position) + _row(_asdict(value), columns))
+            elif op == "delete":
+                c.execute(f"DELETE FROM {_TABLES[type(value)][0]} WHERE budget_id = ? AND id = ?", (budget_id, value.id))
+            c.execute("UPDATE budgets SET modified = ? WHERE id = ?", (time.time(), budget_id))
+
+
+def _insert(table: str, columns: Tuple[str, ...], parent: str = None) -> str:
+    # An object which is added again, e.g. an entry which moves to another group, keeps its row
+    names = ("budget_id", "id") + ((parent,) if parent else ()) + ("position",) + columns
+    return (
+        f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+        f"ON CONFLICT(budget_id, id) DO UPDATE SET {', '.join(f'{x} = excluded.{x}' for x in names[2:])}"
+    )
+
+
+def _next_position(c, table: str, budget_id: str, where: str = None, *args) -> int:
+    # Positions only order the rows, so the gaps left by deleted rows are not filled
+    condition = f" AND {where}" if where else ""
+    return c.execute(
+        f"SELECT COALESCE(MAX(position) + 1, 0) FROM {table} WHERE budget_id = ?{condition}", (budget_id,) + args
+    ).fetchone()[0]
+
+
+def _asdict(obj) -> dict:
+    return {x: getattr(obj, x) for x in _TABLES[type(obj)][1]}
+
+
+class VersionStamps:
+    """
+    Version stamps shared by the processes using the same file, e.g. the workers of the web server. A process bumps
+    the stamp of a budget when it changes it, so the others can tell that their copy is stale by comparing the stamp
+    with the one they loaded. The stamp of CATALOG changes when budgets are created or deleted.
+    """
+
+    CATALOG = ""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A forked worker must not use the connection of its parent
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS stamps (id TEXT PRIMARY KEY, stamp INTEGER NOT NULL)")
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            row = self._connect().execute("SELECT stamp FROM stamps WHERE id = ?", (key,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def bump(self, key: str, expected: int = None) -> Tuple[int, bool]:
+        """
+        Increments the stamp. Returns the new stamp and whether the stamp was `expected` before, i.e. whether no
+        other process changed the budget since it was loaded.
+        """
+        with self._lock:
+            c = self._connect()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                row = c.execute("SELECT stamp FROM stamps WHERE id = ?", (key,)).fetchone()
+                stamp = 0 if row is None else row[0]
+                c.execute(
+                    "INSERT INTO stamps (id, stamp) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET stamp = excluded.stamp",
+                    (key, stamp + 1)
+                )
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            c.execute("COMMIT")
+        return stamp + 1, expected is None or stamp == expected
+
+
+def migrate(directory: str | Path, database: str | Path, overwrite: bool = False) -> int:
+    """
+    Imports the budgets saved in a directory, including the changes in their journals, into a database. Budgets
+    which are already in the database are skipped unless `overwrite` is set. Returns the number of budgets imported.
+    """
+    db = BudgetDatabase(database)
+    imported = 0
+    try:
+        for file in sorted(Path(directory).iterdir()):
+            if not is_budget_file(file):
+                continue
+            try:
+                budget = Budget.load(str(file))
+            except Exception as exc:
+                logging.warning(f"Could not import {file}", exc_info=exc)
+                continue
+            if budget.id in db and not overwrite:
+                logging.info(f"Skipped {file}, budget {budget.id} is already imported")
+                continue
+            db.write(budget.to_dict())
+            imported += 1
+            logging.info(f"Imported {file}")
+    finally:
+        db.close()
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports a directory of budget files into a SQLite database")
+    parser.add_argument("directory")
+    parser.add_argument("database")
+    parser.add_argument("--overwrite", action="store_true", help="Replace budgets which are already imported")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(f"Imported {migrate(args.directory, args.database, args.overwrite)} budgets")
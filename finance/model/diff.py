@@ -0,0 +1,177 @@
+import copy
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Union
+
+from finance.model.codec import codec_for
+from finance.model.entry import Budget
+from finance.model.journal import apply_record
+
+# The attributes of the budget itself which are compared. The lists of children are compared by id.
+BUDGET_FIELDS = ("name", "budget_accounts", "extra")
+
+
+@dataclass
+class ChangeSet:
+    """
+    The changes which turns one budget into another, as records in the format of the journal:
+
+    - {"op": "delete", "parent": id, "name": list name, "id": id} for each removed group, entry, transfer or account
+    - {"op": "add", "parent": id, "name": list name, "value": dict} for each added one
+    - {"op": "set", "id": id, "name": field, "value": value} for each changed field
+
+    A group which is added or removed carries its entries, and an entry which moves to another group is removed
+    from the old group and added to the new one. Lists are kept in the order of the new budget: when items have
+    moved within a list, `moved` removes and adds again, in the new order, every item from the first one which is out
+    of place to the end of the list.
+    """
+
+    removed: List[dict] = field(default_factory=list)
+    added: List[dict] = field(default_factory=list)
+    modified: List[dict] = field(default_factory=list)
+    moved: List[dict] = field(default_factory=list)
+
+    def __iter__(self):
+        # Removals go first, so an id which moves is never in the budget twice. Additions go after modifications, so
+        # renaming an account does not rename it on what is added, and moves go last, as they add items as they are
+        # in the new budget.
+        yield from self.removed
+        yield from self.modified
+        yield from self.added
+        yield from self.moved
+
+    def __len__(self):
+        return len(self.removed) + len(self.added) + len(self.modified) + len(self.moved)
+
+
+def _as_dict(budget: Union[Budget, dict, str, Path]) -> dict:
+    if isinstance(budget, Budget):
+        # The snapshot is cached until the budget changes, so diffing an unchanged budget is cheap
+        return budget._snapshot()
+    if isinstance(budget, dict):
+        return budget
+    return codec_for(budget).read(budget)
+
+
+def _set(_id: str, name: str, value) -> dict:
+    # Lists and dicts are copied, as they would otherwise be shared between the two budgets once applied
+    if isinstance(value, (list, dict)):
+        value = copy.deepcopy(value)
+    return {"op": "set", "id": _id, "name": name, "value": value}
+
+
+def _diff_fields(old: dict, new: dict, modified: List[dict], skip=()):
+    for key, value in new.items():
+        if key not in skip and old.get(key) != value:
+            modified.append(_set(old["id"], key, value))
+
+
+def _rename_accounts(budget: dict, renames: Dict[str, str]) -> dict:
+    """
+    The budget after the accounts are renamed from the old to the new names, as done by `Budget._rename_account`.
+    """
+    def rename(name):
+        return renames.get(name, name)
+
+    budget = dict(budget)
+    for key in ("expenses", "incomes"):
+        budget[key] = [
+            {**grp, "entries": [{**x, "account": rename(x["account"])} for x in grp["entries"]]} for grp in budget[key]
+        ]
+    budget["transfers"] = [
+        {**x, "source": rename(x["source"]), "destination": rename(x["destination"])} for x in budget["transfers"]
+    ]
+    budget["budget_accounts"] = [rename(x) for x in budget["budget_accounts"]]
+    layout = budget["extra"].get("account-layout")
+    if layout:
+        budget["extra"] = {**budget["extra"], "account-layout": {rename(k): v for k, v in layout.items()}}
+    return budget
+
+
+def _diff_list(parent_id: str, name: str, old: List[dict], new: List[dict], changes: ChangeSet,
+               children: Dict[str, tuple] = None):
+    old_by_id = {x["id"]: x for x in old}
+    new_ids = {x["id"] for x in new}
+
+    # The items before `start` are in the same order in both lists. When any item after it is in the old list, the
+    # items from there on are added again in the new order.
+    kept = [x["id"] for x in old if x["id"] in new_ids]
+    start = 0
+    while start < min(len(kept), len(new)) and new[start]["id"] == kept[start]:
+        start += 1
+    moved = any(x["id"] in old_by_id for x in new[start:])
+
+    for idx, x in enumerate(new):
+        previous = old_by_id.get(x["id"])
+        add = {"op": "add", "parent": parent_id, "name": name, "value": x}
+        readded = moved and idx >= start
+        if readded:
+            if previous is not None:
+                changes.moved.append({"op": "delete", "parent": parent_id, "name": name, "id": x["id"]})
+            changes.moved.append(add)
+        elif previous is None:
+            changes.added.append(add)
+        if previous is not None and previous != x:
+            if children is None:
+                _diff_fields(previous, x, changes.modified)
+            else:
+                _diff_fields(previous, x, changes.modified, skip=("entries",))
+                entries = x["entries"]
+                if readded:
+                    # The group is added again with its entries, so only the entries which leave it are removed
+                    ids = {entry["id"] for entry in entries}
+                    entries = [entry for entry in previous["entries"] if entry["id"] in ids]
+                children[x["id"]] = (previous["entries"], entries)
+    for x in old:
+        if x["id"] not in new_ids:
+            changes.removed.append({"op": "delete", "parent": parent_id, "name": name, "id": x["id"]})
+
+
+def diff(old: Union[Budget, dict, str, Path], new: Union[Budget, dict, str, Path]) -> ChangeSet:
+    """
+    Compares two budgets by the ids of their groups, entries, transfers and accounts. Either side can be a budget,
+    a dict as returned by `Budget.to_dict` or the path of a saved budget. The change set applies to `old`, so
+    changes to the budget itself refers to the id of `old`.
+    """
+    old, new = _as_dict(old), _as_dict(new)
+    changes = ChangeSet()
+    budget_id = old["id"]
+
+    # Accounts go first. Renaming an account also renames it where it is used, so the rest is compared to the old
+    # budget as it looks after the renames.
+    old_names = {x["id"]: x["name"] for x in old["accounts"]}
+    renamed = {
+        x["id"]: x["name"] for x in new["accounts"] if x["id"] in old_names and old_names[x["id"]] != x["name"]
+    }
+    if any(x in old_names.values() for x in renamed.values()):
+        # An account renamed to the old name of another, e.g. when two names are swapped, would take over where the
+        # other one is used, so each renamed account is first renamed to its id, which no account is named
+        for _id in renamed:
+            changes.modified.append(_set(_id, "name", _id))
+    _diff_list(budget_id, "accounts", old["accounts"], new["accounts"], changes)
+    if renamed:
+        old = _rename_accounts(old, {old_names[_id]: name for _id, name in renamed.items()})
+
+    for key in BUDGET_FIELDS:
+        if old[key] != new[key]:
+            changes.modified.append(_set(budget_id, key, new[key]))
+    _diff_list(budget_id, "transfers", old["transfers"], new["transfers"], changes)
+
+    # The entries of the groups in both budgets which have changed, by group id. An entry which moves between
+    # groups is a removal from the old group and an addition to the new one.
+    groups = {}
+    for name in ("expenses", "incomes"):
+        _diff_list(budget_id, name, old[name], new[name], changes, groups)
+    # An entry can only move between groups which have changed, so only their entries are compared
+    for grp_id, (old_group_entries, new_group_entries) in groups.items():
+        _diff_list(grp_id, "entries", old_group_entries, new_group_entries, changes)
+    return changes
+
+
+def apply(budget: Budget, changes: ChangeSet):
+    """
+    Applies a change set from `diff` to the budget in a single batch.
+    """
+    with budget.batch():
+        for record in changes:
+            apply_record(budget, record)
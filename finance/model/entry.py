@@ -1,35 +1,69 @@
+import copy
 import dataclasses
-import json
 import logging
-import os
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
+from itertools import count
+from operator import attrgetter
 from pathlib import Path
-from typing import List, Union, Any, Dict
+from typing import List, Union, Any, Dict, Optional, TYPE_CHECKING
 from uuid import uuid4
 
+from finance.model.codec import codec_for
+from finance.model.frame import BudgetFrame, EXPENSE, INCOME
+from finance.model.ledger import AccountLedger
+
+if TYPE_CHECKING:
+    from finance.model.journal import Journal
+
+
+class GroupNotFoundError(Exception):
+    pass
+
 
 class Observable:
+    """
+    Base class of the model objects. Writes to public attributes are reported to the listeners registered with
+    `register_on_update` as `listener(obj, name, value)` and passed on to the parent container (the group of an
+    entry, the budget of a group, transfer or account) through `_on_child_update`.
 
-    def __init__(self):
-        self._on_update_listeners = []
+    While the budget an object belongs to is in a `Budget.batch`, the listeners are not called until the batch ends.
+    """
 
-    def register_on_update(self, callback):
-        self._on_update_listeners.append(callback)
+    __slots__ = ("_on_update_listeners", "_parent")
 
-    def notify(self, name, value):
-        for listener in self._on_update_listeners:
-            listener(self, name, value)
+    # The notifications held back by an ongoing batch. Only set on budgets.
+    _pending = None
 
-    def __post_init__(self):
-        setattr(self, "_on_update_listeners", [])
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls)
+        object.__setattr__(self, "_on_update_listeners", [])
+        object.__setattr__(self, "_parent", None)
+        return self
 
-        def method(self, name, value):
-            super(self.__class__, self).__setattr__(name, value)
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Private attributes are internal bookkeeping and are not observed
+        if name[0] != "_" and (self._on_update_listeners or self._parent is not None):
             self.notify(name, value)
 
-        meths = {'__setattr__': method}
-        self.__class__ = type('Observable', (self.__class__,), meths)
+    def register_on_update(self, callback):
+        self._on_update_listeners.append(callback)
+
+    def notify(self, name, value):
+        if self._on_update_listeners:
+            root = self
+            while root._parent is not None:
+                root = root._parent
+            if root._pending is None:
+                for listener in self._on_update_listeners:
+                    listener(self, name, value)
+            else:
+                root._pending[(id(self), name)] = (self, name, value)
+        if self._parent is not None:
+            self._parent._on_child_update(self, name, value)
 
 
 class AccountType(str, Enum):
@@ -40,7 +74,7 @@ class AccountType(str, Enum):
     Budget = "Budget"
 
 
-@dataclass
+@dataclass(slots=True)
 class Account(Observable):
 
     name: str
@@ -49,7 +83,19 @@ class Account(Observable):
     id: str = field(default_factory=lambda: str(uuid4()))
 
 
-@dataclass
+def _remove_identical(items: list, obj):
+    # list.remove compares with ==, which for dataclasses compares every field of every item before the match
+    del items[next(i for i, x in enumerate(items) if x is obj)]
+
+
+# The fields of an Entry which affects Entry.monthly
+MONTHLY_FIELDS = ("payment_size", "payment_fee", "payment_period")
+
+# The fields of an Entry which are tracked by the AccountLedger
+LEDGER_FIELDS = ("account", "name", "first_payment_month") + MONTHLY_FIELDS
+
+
+@dataclass(slots=True)
 class Entry(Observable):
 
     name: str
@@ -82,23 +128,57 @@ class EntryGroup(Observable):
     entries: List[Entry] = field(default_factory=list)
     id: str = field(default_factory=lambda: str(uuid4()))
 
+    def __post_init__(self):
+        # The monthly amount of each entry as last seen, keyed by object identity, and their sum
+        self._monthly = {}
+        self._total = 0.0
+        for entry in self.entries:
+            self._adopt(entry)
+
+    def _adopt(self, entry: Entry):
+        entry._parent = self
+        self._monthly[id(entry)] = entry.monthly()
+        self._total += self._monthly[id(entry)]
+
+    def _on_child_update(self, entry: Entry, name, value):
+        if name in MONTHLY_FIELDS and id(entry) in self._monthly:
+            monthly = entry.monthly()
+            self._total += monthly - self._monthly[id(entry)]
+            self._monthly[id(entry)] = monthly
+        if self._parent is not None:
+            self._parent._on_entry_update(self, entry, name, value)
+        self.notify("entries", self.entries)
+
     def add_entry(self, entry: Entry):
         self.entries.append(entry)
-        entry.register_on_update(lambda x, y, z: self.notify("entries", self.entries))
+        self._adopt(entry)
+        if self._parent is not None:
+            self._parent._on_entry_added(self, entry)
         self.notify("entries", self.entries)
 
     def delete_entry(self, entry: Entry):
-        if entry in self.entries:
-            self.entries.remove(entry)
+        if entry._parent is self:
+            _remove_identical(self.entries, entry)
+            entry._parent = None
+            self._total -= self._monthly.pop(id(entry), 0.0)
+            if self._parent is not None:
+                self._parent._on_entry_removed(self, entry)
             self.notify("entries", self.entries)
             return True
         return False
 
     def total_monthly(self):
-        return sum(x.monthly() for x in self.entries)
+        return self._total
 
+    @staticmethod
+    def from_dict(data: dict):
+        grp = EntryGroup(data["name"], id=data.get("id", str(uuid4())))
+        for e in data["entries"]:
+            grp.add_entry(Entry(**e))
+        return grp
 
-@dataclass
+
+@dataclass(slots=True)
 class Transfer(Observable):
 
     name: str
@@ -109,6 +189,13 @@ class Transfer(Observable):
     id: str = field(default_factory=lambda: str(uuid4()))
 
 
+# The fields of a Budget which holds its groups, transfers and accounts
+CONTAINER_FIELDS = ("expenses", "incomes", "transfers", "accounts")
+
+# Budget versions are drawn from a single counter, so no two budgets in the process ever share a version
+_versions = count(1)
+
+
 @dataclass
 class Budget(Observable):
 
@@ -121,16 +208,291 @@ class Budget(Observable):
     id: str = field(default_factory=lambda: str(uuid4()))
     extra: Dict[str, Any] = field(default_factory=dict)
 
+    def __post_init__(self):
+        self._frame = None
+        self._batch_depth = 0
+        self._snapshot_cache = None
+        self._on_change_listeners = [
+            self._drop_snapshot, self._invalidate_frame, self._update_index, self._bump_version
+        ]
+        self._version = next(_versions)
+        # Every group, entry, transfer and account by id. The group of an entry is its _parent.
+        self._index = {}
+        # The kind and total of each group as last seen, keyed by object identity, and the sum over expenses
+        # and incomes
+        self._group_kinds = {}
+        self._group_totals = {}
+        self._totals = {EXPENSE: 0.0, INCOME: 0.0}
+        self._ledger = AccountLedger()
+        # The name of each account as last seen, keyed by object identity, used to propagate renames
+        self._account_names = {}
+        for entry_group in self.expenses:
+            self._adopt_group(EXPENSE, entry_group)
+        for entry_group in self.incomes:
+            self._adopt_group(INCOME, entry_group)
+        for transfer in self.transfers:
+            self._adopt_transfer(transfer)
+        for account in self.accounts:
+            self._adopt_account(account)
+        for x in self.expenses + self.incomes + self.transfers + self.accounts:
+            self._add_to_index(x)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # The fields set by __init__ are not reported, as the change listeners are set up in __post_init__
+        if name[0] != "_" and "_on_change_listeners" in self.__dict__:
+            self.notify(name, value)
+
+    def _adopt_group(self, kind: int, entry_group: EntryGroup):
+        entry_group._parent = self
+        self._group_kinds[id(entry_group)] = kind
+        self._group_totals[id(entry_group)] = entry_group.total_monthly()
+        self._totals[kind] += entry_group.total_monthly()
+        for entry in entry_group.entries:
+            self._ledger.add_entry(kind, entry)
+
+    def _release_group(self, kind: int, entry_group: EntryGroup):
+        entry_group._parent = None
+        self._group_kinds.pop(id(entry_group), None)
+        self._totals[kind] -= self._group_totals.pop(id(entry_group), 0.0)
+        for entry in entry_group.entries:
+            self._ledger.remove_entry(entry)
+
+    def _adopt_transfer(self, transfer: Transfer):
+        transfer._parent = self
+        self._ledger.add_transfer(transfer)
+
+    def _adopt_account(self, account: Account):
+        account._parent = self
+        self._account_names[id(account)] = account.name
+
+    def register_on_change(self, callback):
+        """
+        Registers a callback which is called as `callback(op, obj, name, value)` for every change to the budget or
+        anything in it, also during a batch:
+
+        - ("set", obj, name, value) when an attribute of the budget, a group, entry, transfer or account is set
+        - ("add", parent, name, child) when a child is added to the list `name` of its parent
+        - ("delete", parent, name, child) when a child is removed from the list `name` of its parent
+
+        Budget.add_extra is reported as setting "extra".
+        """
+        self._on_change_listeners.append(callback)
+
+    def unregister_on_change(self, callback):
+        self._on_change_listeners.remove(callback)
+
+    def _changed(self, op: str, obj, name: str, value):
+        for listener in self._on_change_listeners:
+            listener(op, obj, name, value)
+
+    def notify(self, name, value):
+        if name not in CONTAINER_FIELDS:
+            self._changed("set", self, name, value)
+        super().notify(name, value)
+
+    def _add_to_index(self, obj):
+        self._index[obj.id] = obj
+        for entry in getattr(obj, "entries", ()):
+            self._index[entry.id] = entry
+
+    def _update_index(self, op, obj, name, value):
+        if op == "add":
+            self._add_to_index(value)
+        elif op == "delete":
+            self._index.pop(value.id, None)
+            for entry in getattr(value, "entries", ()):
+                self._index.pop(entry.id, None)
+        elif name == "id" and obj is not self:
+            # Changing ids is rare, so finding the old key by a scan is fine
+            for key in [k for k, v in self._index.items() if v is obj]:
+                del self._index[key]
+            self._index[value] = obj
+
+    def group_kind(self, entry_group: EntryGroup) -> int | None:
+        """
+        EXPENSE or INCOME for a group of the budget, otherwise None.
+        """
+        return self._group_kinds.get(id(entry_group)) if entry_group._parent is self else None
+
+    def find(self, _id: str):
+        """
+        The group, entry, transfer or account with the given id, or None. The group of an entry is found with
+        `group_of`.
+        """
+        return self._index.get(_id)
+
+    def group_of(self, _id: str) -> EntryGroup | None:
+        entry = self._index.get(_id)
+        return entry._parent if isinstance(entry, Entry) else None
+
+    def _on_entry_added(self, entry_group: EntryGroup, entry: Entry):
+        self._ledger.add_entry(self._group_kinds[id(entry_group)], entry)
+        self._changed("add", entry_group, "entries", entry)
+
+    def _on_entry_removed(self, entry_group: EntryGroup, entry: Entry):
+        self._ledger.remove_entry(entry)
+        self._changed("delete", entry_group, "entries", entry)
+
+    def _on_entry_update(self, entry_group: EntryGroup, entry: Entry, name, value):
+        if name in LEDGER_FIELDS:
+            self._ledger.update_entry(entry)
+        self._changed("set", entry, name, value)
+
+    def _rename_account(self, old: str, new: str):
+        with self.batch():
+            for x in self._ledger.references(old):
+                if isinstance(x, Entry):
+                    x.account = new
+                else:
+                    if x.source == old:
+                        x.source = new
+                    if x.destination == old:
+                        x.destination = new
+            self.budget_accounts = [new if x == old else x for x in self.budget_accounts]
+            layout = self.extra.get("account-layout", {})
+            if old in layout:
+                layout[new] = layout.pop(old)
+                self.add_extra("account-layout", layout)
+
+    def _on_child_update(self, child: Observable, name, value):
+        if isinstance(child, EntryGroup):
+            kind = self._group_kinds[id(child)]
+            total = child.total_monthly()
+            self._totals[kind] += total - self._group_totals[id(child)]
+            self._group_totals[id(child)] = total
+            if name != "entries":
+                self._changed("set", child, name, value)
+            if kind == EXPENSE:
+                self.notify("expenses", self.expenses)
+            else:
+                self.notify("incomes", self.incomes)
+        elif isinstance(child, Transfer):
+            self._ledger.update_transfer(child)
+            self._changed("set", child, name, value)
+            self.notify("transfers", self.transfers)
+        elif isinstance(child, Account):
+            self._changed("set", child, name, value)
+            old_name = self._account_names[id(child)]
+            if name == "name" and value != old_name:
+                self._account_names[id(child)] = value
+                self._rename_account(old_name, value)
+            self.notify("accounts", self.accounts)
+
+    @contextmanager
+    def batch(self):
+        """
+        Holds back the change notifications of the budget and everything in it until the outermost batch ends. The
+        notifications are then coalesced, so each listener is called once per changed object and attribute with
+        the latest value. Totals, balances and other internal bookkeeping are still kept up to date during the batch.
+        """
+        if self._batch_depth == 0:
+            self._pending = {}
+            self._batch_version = self._version
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                pending, self._pending = self._pending, None
+                for obj, name, value in pending.values():
+                    for listener in obj._on_update_listeners:
+                        listener(obj, name, value)
+                # Results memoized during the batch are keyed by a version bumped before the held back listeners
+                # were called, so the budget gets a new version once they have caught up
+                if self._version != self._batch_version:
+                    self._version = next(_versions)
+
+    def _invalidate_frame(self, op, obj, name, value):
+        # A change listener rather than an update listener, so the frame is also current during a batch
+        self._frame = None
+
+    @property
+    def frame(self) -> BudgetFrame:
+        """
+        Columnar view of the budget. It is rebuilt lazily on first access after the budget has changed.
+        """
+        if self._frame is None:
+            self._frame = BudgetFrame(self)
+        return self._frame
+
     def copy(self):
-        budget = Budget.from_dict(self.to_dict())
-        budget.id = str(uuid4())
+        """
+        Creates a copy of the budget with a new id. The copy shares a snapshot of this budget, which is only turned
+        into groups, entries, transfers and accounts when any of them are first read, see `materialize`. Until then,
+        the copy can be saved, renamed and copied again without building any of them. The snapshot is reused by
+        further copies until this budget changes, so branching a budget is close to constant time.
+        """
+        return Budget._from_snapshot(self._snapshot(), str(uuid4()))
+
+    def _snapshot(self) -> dict:
+        # The snapshot is shared between copies and must not be modified. It is replaced, not changed, when the
+        # budget changes.
+        data = self.__dict__.get("_cow_snapshot")
+        if data is not None:
+            return {**data, "name": self.name}
+        if self._snapshot_cache is None:
+            self._snapshot_cache = self.to_dict()
+        return self._snapshot_cache
+
+    def _drop_snapshot(self, op, obj, name, value):
+        self._snapshot_cache = None
+
+    def _bump_version(self, op, obj, name, value):
+        self._version = next(_versions)
+
+    @property
+    def version(self) -> int:
+        """
+        Changes on every change to the budget or anything in it. Versions are unique across all budgets, so
+        (id, version) identifies the state of a budget.
+        """
+        return self._version
+
+    @staticmethod
+    def _from_snapshot(data: dict, _id: str) -> "Budget":
+        budget = Budget.__new__(Budget)
+        # Set directly, as a copy is not observable before it is materialized. The attributes in MATERIALIZED are
+        # left out, so they are read through _Materialized.
+        budget.__dict__.update(
+            name=data["name"], id=_id, _cow_snapshot=data, _frame=None, _batch_depth=0, _snapshot_cache=None,
+            _on_change_listeners=[
+                budget._drop_snapshot, budget._invalidate_frame, budget._update_index, budget._bump_version
+            ],
+            _version=next(_versions), _materialize_lock=threading.Lock()
+        )
         return budget
 
+    def materialize(self):
+        """
+        Turns the snapshot a copy was made from into its own groups, entries, transfers and accounts. This happens
+        on the first read of any of them, so it is only needed to control when the work is done.
+
+        Threads reading a copy at the same time, e.g. the parallel renders of a new budget, wait for the one which
+        materializes it.
+        """
+        if "_cow_snapshot" not in self.__dict__:
+            return
+        with self._materialize_lock:
+            data = self.__dict__.get("_cow_snapshot")
+            if data is None:
+                return
+            # Everything but extra is copied into new objects by from_dict. Extra is changed in place, e.g. when an
+            # account is renamed, so it must not be shared with the snapshot.
+            source = Budget.from_dict({**data, "extra": copy.deepcopy(data.get("extra", {}))})
+            for name in MATERIALIZED:
+                self.__dict__[name] = source.__dict__[name]
+            for x in self.expenses + self.incomes + self.transfers + self.accounts:
+                x._parent = self
+            # Removed last, as other threads take the budget as materialized once it is gone
+            del self.__dict__["_cow_snapshot"]
+
     def total_monthly(self):
-        return sum(x.total_monthly() for x in self.expenses)
+        return self._totals[EXPENSE]
 
     def total_monthly_income(self):
-        return sum(x.total_monthly() for x in self.incomes)
+        return self._totals[INCOME]
 
     def all_expenses(self) -> List[Entry]:
         result = []
@@ -140,22 +502,40 @@ class Budget(Observable):
         return result
 
     def expense_grp_from_id(self, _id: str):
-        return next(x for x in self.expenses if x.id == _id)
+        return self._grp_from_id(EXPENSE, _id)
 
     def income_grp_from_id(self, _id: str):
-        return next(x for x in self.incomes if x.id == _id)
+        return self._grp_from_id(INCOME, _id)
+
+    def _grp_from_id(self, kind: int, _id: str):
+        grp = self._index.get(_id)
+        if not isinstance(grp, EntryGroup) or self._group_kinds.get(id(grp)) != kind:
+            raise GroupNotFoundError(_id)
+        return grp
 
     def add_expense_group(self, entry_group: EntryGroup):
-        entry_group.register_on_update(lambda x, y, z: self.notify("expenses", self.expenses))
+        self._adopt_group(EXPENSE, entry_group)
         self.expenses.append(entry_group)
+        self._changed("add", self, "expenses", entry_group)
+        self.notify("expenses", self.expenses)
 
     def add_incomes_group(self, entry_group: EntryGroup):
-        entry_group.register_on_update(lambda x, y, z: self.notify("incomes", self.incomes))
+        self._adopt_group(INCOME, entry_group)
         self.incomes.append(entry_group)
+        self._changed("add", self, "incomes", entry_group)
+        self.notify("incomes", self.incomes)
 
     def add_transfer(self, transfer: Transfer):
-        transfer.register_on_update(lambda x,y,z: self.notify("transfers", self.transfers))
+        self._adopt_transfer(transfer)
         self.transfers.append(transfer)
+        self._changed("add", self, "transfers", transfer)
+        self.notify("transfers", self.transfers)
+
+    def add_account(self, account: Account):
+        self._adopt_account(account)
+        self.accounts.append(account)
+        self._changed("add", self, "accounts", account)
+        self.notify("accounts", self.accounts)
 
     def all_incomes(self):
         result = []
@@ -164,89 +544,186 @@ class Budget(Observable):
         return result
 
     def save(self, path: str | Path):
+        """
+        Saves the budget in the format given by the extension of the path, see `finance.model.codec`.
+        """
         logging.info(f"Saving budget to {path}")
-        with open(path, "w+") as f:
-            f.write(json.dumps(self.to_dict(), indent=4, ensure_ascii=False))
+        data = self.__dict__.get("_cow_snapshot")
+        if data is not None:
+            data = {**data, "name": self.name, "id": self.id}
+        else:
+            data = self.to_dict()
+        codec_for(path).write(path, data)
 
     def to_dict(self) -> dict:
-        return dataclasses.asdict(self)
+        """
+        Same result as `dataclasses.asdict`, but without the generic recursion and deep copying of every value.
+        """
+        return {
+            "name": self.name,
+            "expenses": [_encode_group(x) for x in self.expenses],
+            "incomes": [_encode_group(x) for x in self.incomes],
+            "transfers": [_encode_transfer(x) for x in self.transfers],
+            "budget_accounts": list(self.budget_accounts),
+            "accounts": [_encode_account(x) for x in self.accounts],
+            "id": self.id,
+            "extra": copy.deepcopy(self.extra)
+        }
 
     def add_extra(self, key, value):
         self.extra[key] = value
+        self._changed("set", self, "extra", self.extra)
 
     @staticmethod
     def from_dict(data: dict):
         b = Budget(data["name"], id=data["id"])
-        for e_grp in data["expenses"]:
-            grp = EntryGroup(e_grp["name"], id=e_grp.get("id", str(uuid4())))
-
-            for e in e_grp["entries"]:
-                grp.add_entry(Entry(**e))
-            b.add_expense_group(grp)
+        with b.batch():
+            for e_grp in data["expenses"]:
+                b.add_expense_group(EntryGroup.from_dict(e_grp))
 
-        for e_grp in data["incomes"]:
-            grp = EntryGroup(e_grp["name"], id=e_grp.get("id", str(uuid4())))
-            for e in e_grp["entries"]:
-                grp.add_entry(Entry(**e))
-            b.add_incomes_group(grp)
+            for e_grp in data["incomes"]:
+                b.add_incomes_group(EntryGroup.from_dict(e_grp))
 
-        for t in data["transfers"]:
-            b.add_transfer(Transfer(**t))
+            for t in data["transfers"]:
+                b.add_transfer(Transfer(**t))
 
-        for b_acc in data["budget_accounts"]:
-            b.budget_accounts.append(b_acc)
+            for b_acc in data["budget_accounts"]:
+                b.budget_accounts.append(b_acc)
 
-        for acc in data["accounts"]:
-            b.accounts.append(Account(**acc))
+            for acc in data["accounts"]:
+                b.add_account(Account(**acc))
 
-        b.extra = data.get("extra", {})
+            b.extra = data.get("extra", {})
 
         return b
 
     @staticmethod
-    def load(path: str):
-        with open(path, "r") as f:
-            data = json.loads(f.read())
-            b = Budget.from_dict(data)
-            b.path = os.path.abspath(path)
-            return b
-
-    def delete(self, entry: Union[Entry, Transfer]):
+    def load(path: str, journal: Optional["Journal"] = None):
+        """
+        Loads a budget saved with `save`, or the snapshot the journal of the budget was last compacted into, and
+        replays the journal. The journal to replay can be given, so it keeps count of its records.
+        """
+        # Imported here, as the journal is built on top of the model
+        from finance.model.journal import Journal
+
+        snapshot = Journal.snapshot_for(path)
+        budget = Budget.from_dict(codec_for(path).read(snapshot if snapshot.exists() else path))
+        (journal or Journal(Journal.path_for(path))).replay(budget)
+        return budget
+
+    def delete(self, entry: Union[Entry, EntryGroup, Transfer, Account]):
         if isinstance(entry, Entry):
-            for x in self.incomes + self.expenses:
-                if x.delete_entry(entry):
-                    break
+            if entry._parent is not None and entry._parent._parent is self:
+                entry._parent.delete_entry(entry)
+        elif isinstance(entry, EntryGroup):
+            kind = self._group_kinds.get(id(entry)) if entry._parent is self else None
+            if kind == EXPENSE:
+                _remove_identical(self.expenses, entry)
+                self._release_group(EXPENSE, entry)
+                self._changed("delete", self, "expenses", entry)
+                self.notify("expenses", self.expenses)
+            elif kind == INCOME:
+                _remove_identical(self.incomes, entry)
+                self._release_group(INCOME, entry)
+                self._changed("delete", self, "incomes", entry)
+                self.notify("incomes", self.incomes)
         elif isinstance(entry, Transfer):
-            if entry in self.transfers:
-                self.transfers.remove(entry)
+            if entry._parent is self:
+                _remove_identical(self.transfers, entry)
+                entry._parent = None
+                self._ledger.remove_transfer(entry)
+                self._changed("delete", self, "transfers", entry)
                 self.notify("transfers", self.transfers)
+        elif isinstance(entry, Account):
+            if entry._parent is self:
+                _remove_identical(self.accounts, entry)
+                entry._parent = None
+                self._account_names.pop(id(entry), None)
+                self._changed("delete", self, "accounts", entry)
+                self.notify("accounts", self.accounts)
+
+    def payments(self, account: str, month: int) -> List[Entry]:
+        """
+        The expenses paid from the account in the month (1-12), sorted by payment period and name.
+        """
+        return list(self._ledger.payments(account, month))
+
+    def balance(self, account: str):
+        """
+        The monthly balance of the account before and after expenses.
+        """
+        return self._ledger.before(account), self._ledger.after(account)
+
+    def unknown_accounts(self) -> List[str]:
+        """
+        Names of accounts which are referred to by entries or transfers but are not registered on the budget.
+        """
+        return sorted(set(self._ledger.referenced_accounts()) - {x.name for x in self.accounts})
 
     def calculate_balances(self):
-        expense_result = {x.name: 0 for x in self.accounts}
-        income_result = {x.name: 0 for x in self.accounts}
-        transfer_result = {x.name: 0 for x in self.accounts}
-        for x in self.expenses:
-            for e in x.entries:
-                try:
-                    expense_result[e.account] -= e.monthly()
-                except KeyError as exc:
-                    logging.error(f"Could not find expense_result for {e.account}", exc_info=exc)
-
-        for x in self.incomes:
-            for e in x.entries:
-                try:
-                    income_result[e.account] += e.monthly()
-                except KeyError as exc:
-                    logging.error(f"Could not find income_result for {e.account}", exc_info=exc)
-
-        for x in self.transfers:
-            try:
-                transfer_result[x.source] -= x.amount
-            except KeyError as exc:
-                logging.error(f"Could not find transfer_result for {x.source}", exc_info=exc)
-            try:
-                transfer_result[x.destination] += x.amount
-            except KeyError as exc:
-                logging.error(f"Could not find transfer_result for {x.destination}", exc_info=exc)
-
-        return expense_result, income_result, transfer_result
+        ledger = self._ledger
+        return (
+            {x.name: ledger.expense_balance.get(x.name, 0.0) for x in self.accounts},
+            {x.name: ledger.income_balance.get(x.name, 0.0) for x in self.accounts},
+            {x.name: ledger.transfer_balance.get(x.name, 0.0) for x in self.accounts}
+        )
+
+
+class _Materialized:
+    """
+    Attribute of a copy of a budget which is built from its snapshot by `Budget.materialize` on first read. It is
+    only looked up until then, as the attributes set on a budget take precedence over it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, budget: Budget, owner=None):
+        if budget is None:
+            return self
+        budget.materialize()
+        return budget.__dict__[self.name]
+
+
+# The attributes of a budget which a copy only has once it is materialized
+MATERIALIZED = (
+    "expenses", "incomes", "transfers", "budget_accounts", "accounts", "extra",
+    "_index", "_group_kinds", "_group_totals", "_totals", "_ledger", "_account_names"
+)
+
+for _name in MATERIALIZED:
+    setattr(Budget, _name, _Materialized(_name))
+
+
+def _record_encoder(cls):
+    names = tuple(x.name for x in dataclasses.fields(cls))
+    getter = attrgetter(*names)
+    return lambda obj: dict(zip(names, getter(obj)))
+
+
+_encode_entry = _record_encoder(Entry)
+_encode_transfer = _record_encoder(Transfer)
+_encode_account = _record_encoder(Account)
+
+
+def _encode_group(entry_group: EntryGroup) -> dict:
+    return {
+        "name": entry_group.name,
+        "entries": [_encode_entry(x) for x in entry_group.entries],
+        "id": entry_group.id
+    }
+
+
+_ENCODERS = {
+    Entry: _encode_entry,
+    EntryGroup: _encode_group,
+    Transfer: _encode_transfer,
+    Account: _encode_account
+}
+
+
+def encode(obj: Union[Entry, EntryGroup, Transfer, Account]) -> dict:
+    """
+    Encodes a group, entry, transfer or account as a dict, i.e. the same as `dataclasses.asdict`.
+    """
+    return _ENCODERS[type(obj)](obj)
@@ -0,0 +1,195 @@
+import logging
+from typing import Dict, Iterable, List, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from finance.model.entry import Budget, Entry, EntryGroup
+
+
+EXPENSE = 0
+INCOME = 1
+
+MONTHS = np.arange(1, 13)
+
+
+class Codes:
+    """
+    Dictionary encoding of a string column. Values are assigned integer codes in order of appearance.
+    """
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value: str) -> int:
+        try:
+            return self.index[value]
+        except KeyError:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+            return code
+
+    def get(self, value: str, default: int = -1) -> int:
+        return self.index.get(value, default)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class BudgetFrame:
+    """
+    Columnar (struct-of-arrays) view of a budget. Entries from both expenses and incomes are stored row-wise in
+    the same columns and distinguished by the `kind` column. Strings are dictionary encoded, where the accounts
+    registered on the budget always get the first codes.
+
+    The frame is a snapshot - use `Budget.frame` to get one which is kept in sync with the budget.
+    """
+
+    def __init__(self, budget: "Budget"):
+        self.accounts = Codes(x.name for x in budget.accounts)
+        self.n_registered_accounts = len(self.accounts)
+        self.owners = Codes()
+        self.tags = Codes()
+        self.payment_methods = Codes()
+
+        self.groups: List["EntryGroup"] = []
+        self.entries: List["Entry"] = []
+        group_kinds = []
+        kinds = []
+        groups = []
+        for kind, entry_groups in ((EXPENSE, budget.expenses), (INCOME, budget.incomes)):
+            for grp in entry_groups:
+                kinds += [kind] * len(grp.entries)
+                groups += [len(self.groups)] * len(grp.entries)
+                group_kinds.append(kind)
+                self.groups.append(grp)
+                self.entries += grp.entries
+
+        n = len(self.entries)
+        entries = self.entries
+        self.group_kind = np.array(group_kinds, dtype=np.int8)
+        self.kind = np.array(kinds, dtype=np.int8)
+        self.group = np.array(groups, dtype=np.int32)
+        self.payment_size = np.fromiter((x.payment_size for x in entries), dtype=float, count=n)
+        self.payment_fee = np.fromiter((x.payment_fee for x in entries), dtype=float, count=n)
+        self.payment_period = np.fromiter((x.payment_period for x in entries), dtype=np.int32, count=n)
+        self.first_payment_month = np.fromiter((x.first_payment_month for x in entries), dtype=np.int32, count=n)
+        self.account = np.fromiter((self.accounts.encode(x.account) for x in entries), dtype=np.int32, count=n)
+        self.owner = np.fromiter((self.owners.encode(x.owner) for x in entries), dtype=np.int32, count=n)
+        self.tag = np.fromiter((self.tags.encode(x.tag) for x in entries), dtype=np.int32, count=n)
+        self.payment_method = np.fromiter(
+            (self.payment_methods.encode(x.payment_method) for x in entries), dtype=np.int32, count=n
+        )
+
+        transfers = budget.transfers
+        m = len(transfers)
+        self.transfers = list(transfers)
+        self.transfer_amount = np.fromiter((x.amount for x in transfers), dtype=float, count=m)
+        self.transfer_source = np.fromiter((self.accounts.encode(x.source) for x in transfers), dtype=np.int32, count=m)
+        self.transfer_destination = np.fromiter(
+            (self.accounts.encode(x.destination) for x in transfers), dtype=np.int32, count=m
+        )
+
+        self._monthly = None
+        self._pay_mask = None
+        self._schedules = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def monthly(self) -> np.ndarray:
+        """
+        The monthly amount of each entry, i.e. the vectorized version of `Entry.monthly`.
+        """
+        if self._monthly is None:
+            self._monthly = (self.payment_size + self.payment_fee) / self.payment_period
+        return self._monthly
+
+    def pay_mask(self) -> np.ndarray:
+        """
+        Boolean matrix of shape (entries, 12) which is true in the months an entry is paid. This is the vectorized
+        version of `Entry.pay_months`.
+        """
+        if self._pay_mask is None:
+            period = self.payment_period[:, None]
+            offset = (MONTHS[None, :] - self.first_payment_month[:, None]) % 12
+            self._pay_mask = (offset % period == 0) & (offset // period < 12 // period)
+        return self._pay_mask
+
+    def total_monthly(self, kind: int = EXPENSE) -> float:
+        return float(self.monthly()[self.kind == kind].sum())
+
+    def group_totals(self, kind: int = EXPENSE) -> Dict[str, float]:
+        totals = np.bincount(self.group, weights=self.monthly(), minlength=len(self.groups))
+        return {grp.id: float(totals[idx]) for idx, grp in enumerate(self.groups) if self.group_kind[idx] == kind}
+
+    def balances(self):
+        """
+        Monthly expense, income and transfer balances of every registered account. Entries and transfers which
+        refers to unknown accounts are logged and left out.
+        """
+        n = len(self.accounts)
+        monthly = self.monthly()
+        expenses = self.kind == EXPENSE
+
+        expense_result = -np.bincount(self.account[expenses], weights=monthly[expenses], minlength=n)
+        income_result = np.bincount(self.account[~expenses], weights=monthly[~expenses], minlength=n)
+        transfer_result = (
+            np.bincount(self.transfer_destination, weights=self.transfer_amount, minlength=n)
+            - np.bincount(self.transfer_source, weights=self.transfer_amount, minlength=n)
+        )
+
+        for name in self.accounts.values[self.n_registered_accounts:]:
+            logging.error(f"Could not find account {name}")
+
+        names = self.accounts.values[:self.n_registered_accounts]
+        return (
+            {name: float(expense_result[idx]) for idx, name in enumerate(names)},
+            {name: float(income_result[idx]) for idx, name in enumerate(names)},
+            {name: float(transfer_result[idx]) for idx, name in enumerate(names)}
+        )
+
+    def schedules(self) -> np.ndarray:
+        """
+        The amount paid in each month by the entries on each account as a matrix of shape (2, accounts, 12), where
+        the first axis is the kind (EXPENSE or INCOME) and the rows are in the order of the account codes.
+        """
+        if self._schedules is None:
+            n = len(self.accounts)
+            amounts = (self.payment_size + self.payment_fee)[:, None] * self.pay_mask()
+            cells = (self.kind.astype(np.int64) * n + self.account)[:, None] * 12 + (MONTHS - 1)[None, :]
+            schedules = np.bincount(cells.ravel(), weights=amounts.ravel(), minlength=2 * n * 12)
+            self._schedules = schedules.reshape(2, n, 12)
+        return self._schedules
+
+    def monthly_schedule(self, account: str, kind: int = EXPENSE) -> np.ndarray:
+        """
+        The amount paid in each of the 12 months by the entries of the given kind on the given account.
+        """
+        code = self.accounts.get(account)
+        return self.schedules()[kind, code].copy() if code >= 0 else np.zeros(12)
+
+    def transfer_totals(self):
+        """
+        The monthly amount transferred out of and into each account, in the order of the account codes. Transfers to
+        the account itself only counts as outgoing.
+        """
+        n = len(self.accounts)
+        incoming = self.transfer_destination != self.transfer_source
+        return (
+            np.bincount(self.transfer_source, weights=self.transfer_amount, minlength=n),
+            np.bincount(self.transfer_destination[incoming], weights=self.transfer_amount[incoming], minlength=n)
+        )
+
+    def monthly_transfers(self, account: str):
+        """
+        The monthly amount transferred out of and into the given account. Transfers to the account itself only
+        counts as outgoing.
+        """
+        code = self.accounts.get(account)
+        outgoing = self.transfer_source == code
+        incoming = (self.transfer_destination == code) & ~outgoing
+        return float(self.transfer_amount[outgoing].sum()), float(self.transfer_amount[incoming].sum())
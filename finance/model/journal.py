@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+from finance.model.codec import codec_for
+from finance.model.entry import Budget, Entry, EntryGroup, Transfer, Account, encode
+from finance.utils.locks import FileLock
+
+
+# How to create the child added to each kind of list
+_DECODERS = {
+    "entries": lambda data: Entry(**data),
+    "expenses": EntryGroup.from_dict,
+    "incomes": EntryGroup.from_dict,
+    "transfers": lambda data: Transfer(**data),
+    "accounts": lambda data: Account(**data)
+}
+
+
+class Journal:
+    """
+    Append-only log of the changes to a budget, one JSON record per line. The journal of a budget file is stored
+    next to it as `<budget file>.journal` and is replayed by `Budget.load`, so changes which are not yet saved
+    survives a restart or a crash.
+
+    When the path of the budget file is given, the journal is compacted every `compact_after` records, as long as
+    `can_compact` returns True, e.g. while no other process has changed the budget. Compacting writes a snapshot of
+    the budget next to the budget file, see `snapshot_for`, so the budget file itself only changes when the budget is
+    saved. `Budget.load` starts from the snapshot when there is one.
+
+    Records are appended, and the journal is compacted and emptied, while holding `lock`, a lock of the journal file
+    shared by all processes. A process which holds it, e.g. for a whole edit, keeps the others from emptying the
+    journal before they know about the records it appends.
+    """
+
+    def __init__(self, path: str | Path, budget_path: Optional[str | Path] = None, compact_after: int = 1000,
+                 fsync: bool = False, can_compact: Optional[Callable[[], bool]] = None,
+                 lock: Optional[FileLock] = None):
+        self.path = Path(path)
+        self.lock = lock if lock is not None else FileLock(self.path)
+        self.budget_path = budget_path
+        self.compact_after = compact_after
+        self.can_compact = can_compact
+        self.fsync = fsync
+        self.budget: Optional[Budget] = None
+        self.records = 0
+        self._file = None
+
+    @staticmethod
+    def path_for(budget_path: str | Path) -> Path:
+        return Path(f"{budget_path}.journal")
+
+    @staticmethod
+    def snapshot_for(budget_path: str | Path) -> Path:
+        return Path(f"{budget_path}.snapshot")
+
+    def attach(self, budget: Budget):
+        self.budget = budget
+        budget.register_on_change(self._on_change)
+
+    def _on_change(self, op, obj, name, value):
+        if op == "set":
+            record = {"op": op, "id": obj.id, "name": name, "value": value}
+        elif op == "add":
+            record = {"op": op, "parent": obj.id, "name": name, "value": encode(value)}
+        else:
+            record = {"op": op, "parent": obj.id, "name": name, "id": value.id}
+        with self.lock:
+            self.append(record)
+            if self.budget_path is not None and self.records >= self.compact_after and (
+                    self.can_compact is None or self.can_compact()):
+                self.compact()
+
+    def _open(self):
+        file = open(self.path, "ab")
+        # A crash can leave the last record cut off. The next record starts on a new line, so it is not joined with
+        # the cut off one and lost when the journal is replayed.
+        if file.tell():
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    file.write(b"\n")
+        return file
+
+    def append(self, record: dict):
+        with self.lock:
+            if self._file is None:
+                self._file = self._open()
+            # Written as a single line of bytes, so other processes appending to the journal never split a record
+            self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+
+    def compact(self):
+        """
+        Saves the budget to the snapshot next to the budget file and empties the journal.
+        """
+        with self.lock:
+            codec_for(self.budget_path).write(Journal.snapshot_for(self.budget_path), self.budget.to_dict())
+            self._truncate()
+
+    def reset(self):
+        """
+        Removes the snapshot and empties the journal, after the budget has been saved to the budget file.
+        """
+        with self.lock:
+            Journal.snapshot_for(self.budget_path).unlink(missing_ok=True)
+            self._truncate()
+
+    def _truncate(self):
+        self.close()
+        with open(self.path, "w"):
+            pass
+        self.records = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def replay(self, budget: Budget) -> int:
+        """
+        Applies the records of the journal to the budget. A record which cannot be parsed, e.g. because the process
+        died while writing it, is skipped, while a record which cannot be applied ends the replay. Returns the number
+        of records applied.
+        """
+        if not self.path.exists():
+            return 0
+
+        applied = 0
+        with open(self.path, "rb") as f, budget.batch():
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Skipped a record of {self.path} which could not be parsed")
+                    continue
+                try:
+                    apply_record(budget, record)
+                except Exception as exc:
+                    logging.warning(f"Stopped replaying {self.path} after {applied} records", exc_info=exc)
+                    break
+                applied += 1
+        self.records = applied
+        return applied
+
+
+def _find(budget: Budget, _id: str):
+    if _id == budget.id:
+        return budget
+    obj = budget.find(_id)
+    if obj is None:
+        raise KeyError(_id)
+    return obj
+
+
+def apply_record(budget: Budget, record: dict):
+    """
+    Applies a single change record, as written to the journal, to the budget.
+    """
+    op, name = record["op"], record["name"]
+    if op == "set":
+        setattr(_find(budget, record["id"]), name, record["value"])
+    elif op == "add":
+        parent = _find(budget, record["parent"])
+        child = _DECODERS[name](record["value"])
+        if name == "entries":
+            parent.add_entry(child)
+        elif name == "expenses":
+            budget.add_expense_group(child)
+        elif name == "incomes":
+            budget.add_incomes_group(child)
+        elif name == "transfers":
+            budget.add_transfer(child)
+        else:
+            budget.add_account(child)
+    elif op == "delete":
+        budget.delete(_find(budget, record["id"]))
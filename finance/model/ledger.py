@@ -0,0 +1,153 @@
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import count
+from typing import Dict, Iterable, List, TYPE_CHECKING
+
+from finance.model.frame import EXPENSE
+
+if TYPE_CHECKING:
+    from finance.model.entry import Entry, Transfer
+
+
+class AccountLedger:
+    """
+    Index of the expenses, incomes and transfers of each account together with the monthly balances of the
+    accounts and the expenses paid in each month. The ledger is updated incrementally by the budget as entries and
+    transfers are added, changed and removed. Accounts are referred to by name, also accounts which are not
+    registered on the budget.
+    """
+
+    def __init__(self):
+        self.expenses: Dict[str, Dict[int, "Entry"]] = defaultdict(dict)
+        self.incomes: Dict[str, Dict[int, "Entry"]] = defaultdict(dict)
+        self.outgoing: Dict[str, Dict[int, "Transfer"]] = defaultdict(dict)
+        self.incoming: Dict[str, Dict[int, "Transfer"]] = defaultdict(dict)
+
+        self.expense_balance: Dict[str, float] = defaultdict(float)
+        self.income_balance: Dict[str, float] = defaultdict(float)
+        self.transfer_balance: Dict[str, float] = defaultdict(float)
+
+        # The expenses with a positive payment size paid from each account in each month, sorted by their key in
+        # _payment_keys. The keys are (payment period, name, sequence number) and are unique, so an entry can be
+        # found by bisection.
+        self._payments: Dict[str, Dict[int, List["Entry"]]] = defaultdict(lambda: defaultdict(list))
+        self._payment_keys: Dict[str, Dict[int, List[tuple]]] = defaultdict(lambda: defaultdict(list))
+        self._sequence = count()
+
+        # What each entry and transfer contributed with when it was last seen, keyed by object identity
+        self._entries = {}
+        self._transfers = {}
+
+    def add_entry(self, kind: int, entry: "Entry"):
+        account, monthly = entry.account, entry.monthly()
+        if kind == EXPENSE:
+            self.expenses[account][id(entry)] = entry
+            self.expense_balance[account] -= monthly
+        else:
+            self.incomes[account][id(entry)] = entry
+            self.income_balance[account] += monthly
+        self._entries[id(entry)] = (kind, account, monthly, self._add_payments(kind, entry))
+
+    def remove_entry(self, entry: "Entry"):
+        kind, account, monthly, payments = self._entries.pop(id(entry))
+        if kind == EXPENSE:
+            del self.expenses[account][id(entry)]
+            self.expense_balance[account] += monthly
+        else:
+            del self.incomes[account][id(entry)]
+            self.income_balance[account] -= monthly
+        if payments is not None:
+            self._remove_payments(account, *payments)
+        return kind
+
+    def update_entry(self, entry: "Entry"):
+        kind, account, monthly, payments = self._entries[id(entry)]
+        if payments is not None:
+            # Without the sequence number
+            payments = payments[0], payments[1][:-1]
+        if account != entry.account or monthly != entry.monthly() or payments != self._payment_key(kind, entry):
+            self.remove_entry(entry)
+            self.add_entry(kind, entry)
+
+    @staticmethod
+    def _payment_key(kind: int, entry: "Entry"):
+        if kind != EXPENSE or entry.payment_size <= 0:
+            return None
+        return entry.pay_months(), (entry.payment_period, str(entry.name))
+
+    def _add_payments(self, kind: int, entry: "Entry"):
+        payments = self._payment_key(kind, entry)
+        if payments is None:
+            return None
+        months, key = payments
+        key = (*key, next(self._sequence))
+        for month in months:
+            keys = self._payment_keys[entry.account][month]
+            idx = bisect_left(keys, key)
+            keys.insert(idx, key)
+            self._payments[entry.account][month].insert(idx, entry)
+        return months, key
+
+    def _remove_payments(self, account: str, months: List[int], key: tuple):
+        for month in months:
+            keys = self._payment_keys[account][month]
+            idx = bisect_left(keys, key)
+            del keys[idx]
+            del self._payments[account][month][idx]
+
+    def payments(self, account: str, month: int) -> List["Entry"]:
+        """
+        The expenses paid from the account in the month (1-12), sorted by payment period and name. The list is
+        owned by the ledger and must not be modified.
+        """
+        return self._payments.get(account, {}).get(month, [])
+
+    def add_transfer(self, transfer: "Transfer"):
+        source, destination, amount = transfer.source, transfer.destination, transfer.amount
+        self.outgoing[source][id(transfer)] = transfer
+        self.incoming[destination][id(transfer)] = transfer
+        self.transfer_balance[source] -= amount
+        self.transfer_balance[destination] += amount
+        self._transfers[id(transfer)] = (source, destination, amount)
+
+    def remove_transfer(self, transfer: "Transfer"):
+        source, destination, amount = self._transfers.pop(id(transfer))
+        del self.outgoing[source][id(transfer)]
+        del self.incoming[destination][id(transfer)]
+        self.transfer_balance[source] += amount
+        self.transfer_balance[destination] -= amount
+
+    def update_transfer(self, transfer: "Transfer"):
+        if self._transfers[id(transfer)] != (transfer.source, transfer.destination, transfer.amount):
+            self.remove_transfer(transfer)
+            self.add_transfer(transfer)
+
+    def before(self, account: str) -> float:
+        """
+        The monthly balance of the account before expenses, i.e. incomes and transfers.
+        """
+        return self.income_balance.get(account, 0.0) + self.transfer_balance.get(account, 0.0)
+
+    def after(self, account: str) -> float:
+        """
+        The monthly balance of the account after expenses.
+        """
+        return self.before(account) + self.expense_balance.get(account, 0.0)
+
+    def references(self, account: str) -> List:
+        """
+        All entries and transfers which refers to the account.
+        """
+        return [
+            *self.expenses.get(account, {}).values(),
+            *self.incomes.get(account, {}).values(),
+            *self.outgoing.get(account, {}).values(),
+            *self.incoming.get(account, {}).values()
+        ]
+
+    def referenced_accounts(self) -> Iterable[str]:
+        return {
+            account
+            for index in (self.expenses, self.incomes, self.outgoing, self.incoming)
+            for account, items in index.items() if items
+        }
@@ -0,0 +1,101 @@
+import functools
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from finance.model.entry import Budget
+
+
+def _freeze(value):
+    # Arrays are keyed by their content, everything else must be hashable
+    if isinstance(value, np.ndarray):
+        return value.shape, value.dtype.str, value.tobytes()
+    if isinstance(value, Budget):
+        return value.id, value.version
+    if isinstance(value, (list, tuple, range)):
+        return tuple(_freeze(x) for x in value)
+    return value
+
+
+def _read_only(value):
+    # Results are shared by every caller, so arrays are protected against changes in place
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, tuple):
+        for x in value:
+            _read_only(x)
+    return value
+
+
+class Memo:
+    """
+    LRU cache of function results keyed by the function and its arguments, where a budget argument is keyed by its
+    id and version. As the version changes with every change to a budget, results are never stale and entries of
+    old versions are simply evicted.
+
+    The cache holds at most `maxsize` results and, when `sizeof` is given, at most `maxbytes` as measured by it.
+    """
+
+    def __init__(self, maxsize: int = 256, maxbytes: Optional[int] = None, sizeof: Optional[Callable] = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        # The results and their sizes in least recently used order
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, func):
+        """
+        Decorator which memoizes the function in this cache. The results are shared between callers and must not
+        be modified.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, _freeze(args), _freeze(sorted(kwargs.items())))
+            with self._lock:
+                try:
+                    result, _ = self._results[key]
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return result
+                except KeyError:
+                    self.misses += 1
+
+            result = _read_only(func(*args, **kwargs))
+            size = self.sizeof(result) if self.sizeof is not None else 0
+            with self._lock:
+                previous = self._results.pop(key, None)
+                if previous is not None:
+                    self.bytes -= previous[1]
+                self._results[key] = (result, size)
+                self.bytes += size
+                while self._results and (
+                        len(self._results) > self.maxsize
+                        or self.maxbytes is not None and self.bytes > self.maxbytes):
+                    _, (_, evicted_size) = self._results.popitem(last=False)
+                    self.bytes -= evicted_size
+            return result
+
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                hits=self.hits, misses=self.misses, size=len(self._results), maxsize=self.maxsize, bytes=self.bytes,
+                maxbytes=self.maxbytes
+            )
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+memo = Memo()
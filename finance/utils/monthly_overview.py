@@ -1,7 +1,8 @@
-from collections import defaultdict
 from typing import Dict, List
 
 from finance.model.entry import Budget, Entry
+from finance.model.frame import EXPENSE
+from finance.utils.memo import memo
 import numpy as np
 
 
@@ -20,57 +21,79 @@ PERIODS = {
 }
 
 
-def monthly(budget: Budget, account: str):
-    monthly_expenses = np.zeros(12)
-    monthly_incomes = np.zeros(12)
-
-    for e in [_e for _e in budget.all_expenses() if _e.account == account]:
-
-        for m in e.pay_months():
-            monthly_expenses[m-1] += (e.payment_size + e.payment_fee)
-
-    for t in budget.transfers:
-        if t.source == account:
-            monthly_expenses += t.amount
-        elif t.destination == account:
-            monthly_incomes += t.amount
+@memo
+def monthly_all(budget: Budget):
+    """
+    The monthly expenses and incomes of every account, as `monthly` computes them for one, as matrices of shape
+    (accounts, 12). Returns the account names in the order of the rows together with the two matrices.
+    """
+    frame = budget.frame
+    outgoing, incoming = frame.transfer_totals()
 
-    return monthly_expenses, monthly_incomes
-
-
-def expected_saldo(monthly_expenses):
+    monthly_expenses = frame.schedules()[EXPENSE] + outgoing[:, None]
+    monthly_incomes = np.repeat(incoming[:, None], 12, axis=1)
 
-    n = len(monthly_expenses)
+    return frame.accounts.values, monthly_expenses, monthly_incomes
 
-    saldo = np.zeros(n)
-    avg_expense = np.average(monthly_expenses)
-
-    pivot = np.argmax(monthly_expenses)
-
-    for x in range(n):
-        idx = (x + pivot) % n
-        if monthly_expenses[(x + pivot) % n] < avg_expense:
-            break
-        else:
-            pivot = idx
 
+@memo
+def monthly(budget: Budget, account: str):
+    row = budget.frame.accounts.get(account)
+    if row < 0:
+        return np.zeros(12), np.zeros(12)
+    accounts, monthly_expenses, monthly_incomes = monthly_all(budget)
+    return monthly_expenses[row], monthly_incomes[row]
+
+
+def expected_saldos(monthly_expenses: np.ndarray):
+    """
+    Batched version of `expected_saldo` for a 2-D array with a row per account or scenario and a column per period.
+    Returns the saldo of each row and period together with the buffer each row needs to never go below zero, i.e.
+    the negated lowest saldo.
+    """
+    monthly_expenses = np.atleast_2d(np.asarray(monthly_expenses, dtype=float))
+    rows, n = monthly_expenses.shape
+    avg_expense = np.average(monthly_expenses, axis=1)
+    pivot = np.argmax(monthly_expenses, axis=1)
+
+    # The pivot search of expected_saldo moves the pivot to each period which is not below average and looks k
+    # periods further ahead in step k, so it visits the periods at triangular offsets from the largest expense
+    # until one is below average
+    steps = np.arange(n)
+    offsets = steps * (steps + 1) // 2 % n
+    visited = (pivot[:, None] + offsets[None, :]) % n
+    below = np.take_along_axis(monthly_expenses, visited, axis=1) < avg_expense[:, None]
+    stop = np.where(below.any(axis=1), np.argmax(below, axis=1), n)
+    pivot = np.where(stop > 0, visited[np.arange(rows), np.maximum(stop - 1, 0)], pivot)
+
+    # The saldo is accumulated from the pivot one period at a time, in the same order of operations as
+    # expected_saldo, so the results are identical
+    saldo = np.zeros((rows, n))
+    row_idx = np.arange(rows)
     for i in range(1, n):
         idx = (i + pivot) % n
-        saldo[idx] = saldo[idx - 1] - monthly_expenses[idx] + avg_expense
+        saldo[row_idx, idx] = saldo[row_idx, idx - 1] - monthly_expenses[row_idx, idx] + avg_expense
 
-    return saldo
+    return saldo, np.maximum(0.0, -saldo.min(axis=1))
+
+
+@memo
+def expected_saldo(monthly_expenses):
+    saldo, _ = expected_saldos(np.asarray(monthly_expenses, dtype=float)[None, :])
+    return saldo[0]
 
 
+@memo
 def get_monthly_movements(budget: Budget, account: str, months=None) -> Dict[int, List[Entry]]:
     if months is None:
         months = list(range(1, 13))
 
-    groups = defaultdict(list)
+    # A plain dict, as the result is cached and shared by all callers. Months without payments are left out.
+    groups = {}
 
-    for entry in budget.all_expenses():
-        if entry.account == account:
-            for m in entry.pay_months():
-                if entry.payment_size > 0 and m in months:
-                    groups[m].append(entry)
+    for m in months:
+        payments = budget.payments(account, m)
+        if payments:
+            groups[m] = payments
 
     return groups
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from finance.model.entry import Budget
+from finance.model.frame import EXPENSE
+
+
+@dataclass
+class Projection:
+    """
+    Cash flows of every account over a number of years. The matrices have a row per account, in the order of
+    `accounts`, and a column per month, starting with January of the first year. Inflows and outflows are positive
+    amounts, transfers are the net amount transferred into the account.
+    """
+
+    accounts: List[str]
+    years: int
+    inflows: np.ndarray
+    outflows: np.ndarray
+    transfers: np.ndarray
+    balances: np.ndarray
+
+    def row(self, account: str) -> int:
+        return self.accounts.index(account)
+
+    def yearly(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Sums a (accounts, months) matrix of this projection per year.
+        """
+        return matrix.reshape(len(self.accounts), self.years, 12).sum(axis=2)
+
+
+def _rates(ids, group_ids, indexation: Dict[str, float], default: float) -> np.ndarray:
+    # The rate of an entry is its own, else the one of its group, else the default
+    if not indexation:
+        return np.full(len(ids), default)
+    return np.fromiter(
+        (indexation.get(_id, indexation.get(grp_id, default)) for _id, grp_id in zip(ids, group_ids)),
+        dtype=float, count=len(ids)
+    )
+
+
+def _flows(accounts: np.ndarray, rates: np.ndarray, amounts: np.ndarray, n_accounts: int, years: int):
+    """
+    Sums the (rows, 12) amounts per account and indexes them over the years, giving a (accounts, years * 12) matrix.
+    The rows are bucketed by rate first, so the work only grows with the number of distinct rates.
+    """
+    unique, bucket = np.unique(rates, return_inverse=True)
+    keys = accounts * len(unique) + bucket
+    size = n_accounts * len(unique)
+    base = np.stack([np.bincount(keys, weights=amounts[:, m], minlength=size) for m in range(12)], axis=1)
+    factors = (1 + unique[:, None]) ** np.arange(years)[None, :]
+    result = np.einsum("aum,uy->aym", base.reshape(n_accounts, len(unique), 12), factors)
+    return result.reshape(n_accounts, years * 12)
+
+
+def project(budget: Budget, years: int, indexation: Optional[Dict[str, float]] = None, default_indexation: float = 0.0,
+            start_balances: Optional[Dict[str, float]] = None) -> Projection:
+    """
+    Projects the budget `years` years ahead. Amounts are indexed once a year by the annual rate found in
+    `indexation` by the id of the entry, its group or the transfer, e.g. 0.02 for 2% inflation, and otherwise
+    by `default_indexation`. The running balances starts from `start_balances`, or zero.
+    """
+    frame = budget.frame
+    indexation = indexation or {}
+    n_accounts = len(frame.accounts)
+
+    rates = _rates(
+        [x.id for x in frame.entries], [frame.groups[idx].id for idx in frame.group], indexation, default_indexation
+    )
+    amounts = (frame.payment_size + frame.payment_fee)[:, None] * frame.pay_mask()
+    expenses = frame.kind == EXPENSE
+    outflows = _flows(frame.account[expenses], rates[expenses], amounts[expenses], n_accounts, years)
+    inflows = _flows(frame.account[~expenses], rates[~expenses], amounts[~expenses], n_accounts, years)
+
+    transfer_ids = [x.id for x in frame.transfers]
+    transfer_rates = _rates(transfer_ids, transfer_ids, indexation, default_indexation)
+    transfer_amounts = np.repeat(frame.transfer_amount[:, None], 12, axis=1)
+    transfers = (
+        _flows(frame.transfer_destination, transfer_rates, transfer_amounts, n_accounts, years)
+        - _flows(frame.transfer_source, transfer_rates, transfer_amounts, n_accounts, years)
+    )
+
+    start = np.zeros(n_accounts)
+    for name, balance in (start_balances or {}).items():
+        code = frame.accounts.get(name)
+        if code >= 0:
+            start[code] = balance
+    balances = start[:, None] + np.cumsum(inflows - outflows + transfers, axis=1)
+
+    return Projection(list(frame.accounts.values), years, inflows, outflows, transfers, balances)
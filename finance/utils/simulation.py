@@ -0,0 +1,147 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from finance.model.entry import Budget
+from finance.model.frame import EXPENSE
+
+
+@dataclass
+class Uncertainty:
+    """
+    Uncertainty of the payments of an entry: each payment varies uniformly within ±variance of its size, e.g. 0.1 for
+    ±10%, and happens with the given probability.
+    """
+
+    variance: float = 0.0
+    probability: float = 1.0
+
+
+@dataclass
+class SimulationResult:
+    """
+    Outcome of a simulation. `percentiles` maps each requested percentile to a (accounts, 12) matrix of the balance
+    at the end of each month, `probability_negative` is the share of trials in which the balance of each account
+    went below zero at some point during the year.
+    """
+
+    accounts: List[str]
+    trials: int
+    start_balances: np.ndarray
+    percentiles: Dict[float, np.ndarray]
+    probability_negative: np.ndarray
+
+    def percentile(self, account: str, q: float) -> np.ndarray:
+        return self.percentiles[q][self.accounts.index(account)]
+
+
+def _run_trials(args):
+    seed, trials, scale, offset, probability, starts, cells, budgeted, base, start = args
+    rng = np.random.default_rng(seed)
+    flows = np.tile(base.ravel(), (trials, 1))
+    if len(scale):
+        # A single uniform number decides both whether a payment happens (u < p) and, scaled by 1 / p, its size
+        u = rng.random((trials, len(scale)), dtype=np.float32)
+        payments = u * scale
+        payments += offset
+        payments *= u < probability
+        flows[:, cells] += np.add.reduceat(payments, starts, axis=1) - budgeted
+    balances = start[:, None] + np.cumsum(flows.reshape(trials, *base.shape), axis=2)
+    return balances.astype(np.float32)
+
+
+def simulate(budget: Budget, uncertainty: Dict[str, Uncertainty], trials: int = 10000, seed: int = 0,
+             accounts: Optional[List[str]] = None, start_balances: Optional[Dict[str, float]] = None,
+             percentiles: Sequence[float] = (5, 50, 95), workers: Optional[int] = None,
+             chunk_size: int = 5000) -> SimulationResult:
+    """
+    Simulates a year of the budget `trials` times, where the payments of the entries in `uncertainty`, keyed by the
+    id of the entry, vary by its `variance` and happen with its `probability`. All other payments and the transfers
+    are fixed.
+
+    Each account starts the year with its balance in `start_balances`, or by default the smallest balance which
+    keeps the budgeted balance from going negative, so the result shows the risk added by the uncertainty.
+
+    The trials are run in chunks of `chunk_size` and spread over a pool of `workers` processes when there is more
+    than one chunk. Every chunk has its own random stream derived from `seed`, so the result only depends on the
+    seed and the chunk size, not on the number of workers.
+    """
+    if trials < 1:
+        raise ValueError(f"At least one trial must be simulated, got trials={trials}")
+    if chunk_size < 1:
+        raise ValueError(f"The chunks must hold at least one trial, got chunk_size={chunk_size}")
+    frame = budget.frame
+    if accounts is None:
+        accounts = frame.accounts.values[:frame.n_registered_accounts]
+    # The row of each account code in the result, or -1 when the account is not simulated
+    rows = np.full(len(frame.accounts), -1)
+    for row, name in enumerate(accounts):
+        code = frame.accounts.get(name)
+        if code >= 0:
+            rows[code] = row
+
+    # The uncertainty of each entry of the frame
+    frame_variance = np.zeros(len(frame.entries))
+    frame_probability = np.ones(len(frame.entries))
+    if uncertainty:
+        for idx, entry in enumerate(frame.entries):
+            x = uncertainty.get(entry.id)
+            if x is not None:
+                frame_variance[idx], frame_probability[idx] = x.variance, x.probability
+
+    entries, months = np.nonzero(frame.pay_mask())
+    sign = np.where(frame.kind[entries] == EXPENSE, -1.0, 1.0)
+    amount = sign * (frame.payment_size + frame.payment_fee)[entries]
+    entry_rows = rows[frame.account[entries]]
+    simulated = entry_rows >= 0
+    entries, amount = entries[simulated], amount[simulated]
+    cells = entry_rows[simulated] * 12 + months[simulated]
+
+    # The budgeted flows of each account and month. Without any payments, bincount counts in integers.
+    base = np.bincount(cells, weights=amount, minlength=len(accounts) * 12).astype(float).reshape(len(accounts), 12)
+    for code, direction in ((frame.transfer_destination, 1.0), (frame.transfer_source, -1.0)):
+        transfer_rows = rows[code]
+        selected = transfer_rows >= 0
+        base += direction * np.bincount(
+            transfer_rows[selected], weights=frame.transfer_amount[selected], minlength=len(accounts)
+        )[:, None]
+
+    if start_balances is None:
+        start = np.maximum(0.0, -np.cumsum(base, axis=1).min(axis=1, initial=0.0))
+    else:
+        start = np.array([start_balances.get(name, 0.0) for name in accounts], dtype=float)
+
+    # Only payments which are uncertain are drawn. They are sorted by cell, so they can be summed per cell with
+    # a single reduceat.
+    uncertain = (frame_variance[entries] > 0) | (frame_probability[entries] < 1)
+    order = np.argsort(cells[uncertain], kind="stable")
+    unique_cells, starts = np.unique(cells[uncertain][order], return_index=True)
+    amount = amount[uncertain][order]
+    variance = frame_variance[entries][uncertain][order]
+    probability = frame_probability[entries][uncertain][order]
+    # A payment which happens is amount * (1 - variance + 2 * variance * u / probability) for u < probability
+    scale = np.divide(2 * variance * amount, probability, out=np.zeros_like(amount), where=probability > 0)
+    payments = (
+        scale.astype(np.float32), ((1 - variance) * amount).astype(np.float32), probability.astype(np.float32),
+        starts, unique_cells, np.add.reduceat(amount, starts) if len(amount) else amount
+    )
+
+    sizes = [min(chunk_size, trials - x) for x in range(0, trials, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(s, n, *payments, base, start) for s, n in zip(seeds, sizes)]
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_trials, jobs))
+    else:
+        results = [_run_trials(job) for job in jobs]
+    balances = np.concatenate(results)
+
+    return SimulationResult(
+        accounts=list(accounts),
+        trials=trials,
+        start_balances=start,
+        percentiles=dict(zip(percentiles, np.percentile(balances, percentiles, axis=0))),
+        probability_negative=(balances.min(axis=2) < 0).mean(axis=0)
+    )
@@ -1,25 +1,24 @@
 from dash.exceptions import PreventUpdate
 
-from finance.model.entry import Budget, AccountType
+from finance.model.entry import Budget, Account, AccountType
 
-from dash_extensions.enrich import html, Input, Output, Trigger, State, DashBlueprint
+from dash_extensions.enrich import html, Input, Output, State, DashBlueprint
 from dash_extensions.enrich import dash_table
 
-from finance.webapp.helpers import handle_update, create_add_btn
-from finance.webapp.models import ChangeStoreModel
+from finance.webapp.helpers import apply_rows, create_add_btn, render_cache, skip_unaffected, \
+    edit_budget, rejects_stale_edits
+from finance.webapp.models import ChangeStoreModel, EXPENSES, INCOMES, TRANSFERS, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 bp = DashBlueprint()
 
 
 def create_data_table_data(budget: Budget):
-    expense_balances, income_balances, transfer_balances = budget.calculate_balances()
-
     data = []
     for account in budget.accounts:
-        before = income_balances[account.name] + transfer_balances[account.name]
-        after = before + expense_balances[account.name]
+        before, after = budget.balance(account.name)
         data.append(dict(
+            id=account.id,
             name=account.name,
             owner=account.owner,
             type=account.type,
@@ -29,13 +28,14 @@ def create_data_table_data(budget: Budget):
     return data
 
 
+@render_cache
 def create_data_table(budget: Budget):
     columns = [
         {'id': 'name', 'name': 'Navn', 'type': 'text'},
         {'id': 'owner', 'name': 'Ejer', 'type': 'text'},
         {'id': 'type', 'name': 'Type', 'presentation': 'dropdown', 'type': 'text'},
-        {'id': 'before', 'name': 'Før udgifter', 'type': 'numeric'},
-        {'id': 'after', 'name': 'Efter udgifter', 'type': 'numeric'}
+        {'id': 'before', 'name': 'Før udgifter', 'type': 'numeric', "editable": False},
+        {'id': 'after', 'name': 'Efter udgifter', 'type': 'numeric', "editable": False}
     ]
 
     return dash_table.DataTable(
@@ -72,15 +72,12 @@ def create_data_table(budget: Budget):
     State('selected-budget', 'data'),
     prevent_initial_call=True
 )
+@rejects_stale_edits
 def update_graphs(data: dict, data_previous: dict, budget_idx: str) -> ChangeStoreModel:
-    try:
-        budget = repo.get_budget(budget_idx)
-    except BudgetNotFoundError:
-        raise PreventUpdate()
-
     if data and data_previous and data != data_previous:
-        handle_update(data_previous, data, budget.transfers, "Accounts")
-        return ChangeStoreModel(budget_idx)
+        with edit_budget(budget_idx) as (budget, change):
+            apply_rows(data_previous, data, budget.accounts, Account, budget.delete, budget.add_account, "Accounts")
+        return change
     else:
         raise PreventUpdate()
 
@@ -88,15 +85,17 @@ def update_graphs(data: dict, data_previous: dict, budget_idx: str) -> ChangeSto
 @bp.callback(
     Output('accounts', 'children'),
     Input('selected-budget', 'data'),
-    Trigger('change-store', 'data')
+    Input('change-store', 'data')
 )
-def update(budget_idx: str):
+def update(budget_idx: str, change: ChangeStoreModel):
+    # The balances depend on every entry and transfer
+    skip_unaffected(change, EXPENSES, INCOMES, TRANSFERS, ACCOUNTS)
     try:
-        budget = repo.get_budget(budget_idx)
-        return [
-            create_data_table(budget),
-            create_add_btn("add-transfer")
-        ]
+        with repo.read(budget_idx) as budget:
+            return [
+                create_data_table(budget),
+                create_add_btn("add-transfer")
+            ]
     except BudgetNotFoundError:
         raise PreventUpdate()
 
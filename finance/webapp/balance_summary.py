@@ -1,13 +1,16 @@
 from dash.exceptions import PreventUpdate
-from dash_extensions.enrich import Trigger, Output, html, Input, DashBlueprint
+from dash_extensions.enrich import Output, html, Input, DashBlueprint
 from finance.model.entry import Budget
 import dash_mantine_components as dmc
 
 from finance.webapp.state import repo, BudgetNotFoundError
+from finance.webapp.helpers import render_cache, skip_unaffected
+from finance.webapp.models import ChangeStoreModel, EXPENSES, INCOMES
 
 bp = DashBlueprint()
 
 
+@render_cache
 def create_summary(budget: Budget):
     return dmc.Grid([
         dmc.Col([
@@ -20,7 +23,7 @@ def create_summary(budget: Budget):
                 ),
                 dmc.Center([
                     dmc.Text(f"DKK ", size="xs", mr="xs"),
-                    dmc.Text(f"{sum(x.total_monthly() for x in budget.incomes):0.0f}", size="lg", weight=700)
+                    dmc.Text(f"{budget.total_monthly_income():0.0f}", size="lg", weight=700)
                 ])
             ], withBorder=True)
         ], span=4),
@@ -34,7 +37,7 @@ def create_summary(budget: Budget):
                 ),
                 dmc.Center([
                     dmc.Text(f"DKK ", size="xs", mr="xs"),
-                    dmc.Text(f"{sum(x.total_monthly() for x in budget.expenses):0.0f}", size="lg", weight=700)
+                    dmc.Text(f"{budget.total_monthly():0.0f}", size="lg", weight=700)
                 ])
             ], withBorder=True)
         ], span=4),
@@ -48,7 +51,7 @@ def create_summary(budget: Budget):
                 ),
                 dmc.Center([
                     dmc.Text(f"DKK ", size="xs", mr="xs"),
-                    dmc.Text(f"{sum(x.total_monthly() for x in budget.incomes) - sum(x.total_monthly() for x in budget.expenses):0.0f}", size="lg", weight=700)
+                    dmc.Text(f"{budget.total_monthly_income() - budget.total_monthly():0.0f}", size="lg", weight=700)
                 ])
             ], withBorder=True)
         ], span=4)
@@ -57,12 +60,14 @@ def create_summary(budget: Budget):
 
 @bp.callback(
     Input('selected-budget', 'data'),
-    Trigger("change-store", "data"),
+    Input("change-store", "data"),
     Output("balance-summary", "children")
 )
-def _on_change(budget_idx: str):
+def _on_change(budget_idx: str, change: ChangeStoreModel):
+    skip_unaffected(change, EXPENSES, INCOMES)
     try:
-        return [create_summary(repo.get_budget(budget_idx))]
+        with repo.read(budget_idx) as budget:
+            return [create_summary(budget)]
     except BudgetNotFoundError:
         raise PreventUpdate()
 
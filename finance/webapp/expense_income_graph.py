@@ -1,18 +1,21 @@
 from dash.exceptions import PreventUpdate
-from dash_extensions.enrich import Trigger, dcc, Output, html, Input, DashBlueprint
+from dash_extensions.enrich import dcc, Output, html, Input, DashBlueprint
 from finance.model.entry import Budget
 
 
 import plotly.graph_objects as go
 
 from finance.webapp.state import repo, BudgetNotFoundError
+from finance.webapp.helpers import render_cache, skip_unaffected
+from finance.webapp.models import ChangeStoreModel, EXPENSES, INCOMES
 
 bp = DashBlueprint()
 
 
+@render_cache
 def create_figure(budget: Budget):
     fig = go.Figure()
-    total_monthly = sum(x.total_monthly() for x in budget.expenses)
+    total_monthly = budget.total_monthly()
     if total_monthly:
         for eg in sorted(budget.expenses, key=lambda x: x.total_monthly()):
             fig.add_trace(go.Bar(
@@ -48,12 +51,14 @@ def create_figure(budget: Budget):
 
 @bp.callback(
     Input('selected-budget', 'data'),
-    Trigger("change-store", "data"),
+    Input("change-store", "data"),
     Output("income-graph", "figure")
 )
-def _on_change(budget_idx: str):
+def _on_change(budget_idx: str, change: ChangeStoreModel):
+    skip_unaffected(change, EXPENSES, INCOMES)
     try:
-        return create_figure(repo.get_budget(budget_idx))
+        with repo.read(budget_idx) as budget:
+            return create_figure(budget)
     except BudgetNotFoundError:
         raise PreventUpdate()
 
@@ -9,21 +9,23 @@ from dash_extensions.enrich import html, Output, DashProxy, Trigger, State, Inpu
 import dash_mantine_components as dmc
 from dash_extensions.enrich import dash_table
 
-from finance.webapp.helpers import handle_update, create_add_btn
+from finance.webapp.helpers import apply_rows, create_add_btn, render_cache, skip_unaffected, patch_groups, \
+    edit_budget, rejects_stale_edits, check_unchanged
 from finance.webapp.modal_input import ModalInput
-from finance.webapp.models import ChangeStoreModel
+from finance.webapp.models import ChangeStoreModel, EXPENSES, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 
+def create_row(x: Entry) -> dict:
+    _e = asdict(x)
+    _e["monthly"] = f"{x.monthly():0.2f}"
+    if _e["payment_period"] == 1:
+        _e["first_payment_month"] = 0
+    return _e
+
+
 def create_data_table_data(entry_group: EntryGroup):
-    data = []
-    for x in entry_group.entries:
-        _e = asdict(x)
-        _e["monthly"] = f"{x.monthly():0.2f}"
-        if _e["payment_period"] == 1:
-            _e["first_payment_month"] = 0
-        data.append(_e)
-    return data
+    return [create_row(x) for x in entry_group.entries]
 
 
 def create_data_table(entry_group: EntryGroup, accounts: list[Account]):
@@ -96,36 +98,34 @@ def create_data_table(entry_group: EntryGroup, accounts: list[Account]):
     )
 
 
-def create_table(budget: Budget):
-
-    children = []
-    for entry_group in budget.expenses:
-        children.append(
-            dmc.AccordionItem([
-                dmc.AccordionControl(
-                    [
-                        dmc.Grid([
-                            dmc.Col([dmc.Text(entry_group.name)], span=8),
-                            dmc.Col(dmc.Text(f"{entry_group.total_monthly():0.2f}", align="right"), span=4)
-                        ])
-                    ]
-                ),
-                dmc.AccordionPanel([
-                    dmc.Group([
-                        dmc.Button(
-                            "Tilføj", id=dict(type="add-expense", grp=entry_group.id),
-                            size="xs", mb="5px", variant="outline"
-                        ),
-                        dmc.Button("Omdøb", id=dict(type="rename-expense", grp=entry_group.id), size="xs", mb="5px", variant="outline", color="green"),
-                        dmc.Button("Delete", id=dict(type="delete-expense", grp=entry_group.id), size="xs", mb="5px",
-                                   variant="outline", color="red")
-                    ], position="right"),
-                    create_data_table(entry_group, budget.accounts),
+def create_item(entry_group: EntryGroup, accounts: list[Account]):
+    return dmc.AccordionItem([
+        dmc.AccordionControl(
+            [
+                dmc.Grid([
+                    dmc.Col([dmc.Text(entry_group.name)], span=8),
+                    dmc.Col(dmc.Text(f"{entry_group.total_monthly():0.2f}", align="right"), span=4)
                 ])
-            ], value=entry_group.id)
-        )
+            ]
+        ),
+        dmc.AccordionPanel([
+            dmc.Group([
+                dmc.Button(
+                    "Tilføj", id=dict(type="add-expense", grp=entry_group.id),
+                    size="xs", mb="5px", variant="outline"
+                ),
+                dmc.Button("Omdøb", id=dict(type="rename-expense", grp=entry_group.id), size="xs", mb="5px", variant="outline", color="green"),
+                dmc.Button("Delete", id=dict(type="delete-expense", grp=entry_group.id), size="xs", mb="5px",
+                           variant="outline", color="red")
+            ], position="right"),
+            create_data_table(entry_group, accounts),
+        ])
+    ], value=entry_group.id)
 
-    return children
+
+@render_cache
+def create_table(budget: Budget):
+    return [create_item(entry_group, budget.accounts) for entry_group in budget.expenses]
 
 
 def create_callbacks(app: DashProxy):
@@ -133,22 +133,24 @@ def create_callbacks(app: DashProxy):
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
         Trigger(dict(type="delete-expense", grp=ALL), 'n_clicks'),
-        State('selected-budget', 'data')
+        State('selected-budget', 'data'),
+        State(dict(type='expense-table', grp=ALL), 'id'),
+        State(dict(type='expense-table', grp=ALL), 'data')
     )
-    def delete_expense_grp(budget_idx: str):
+    @rejects_stale_edits
+    def delete_expense_grp(budget_idx: str, table_ids: list, tables: list):
 
         t = get_triggered()
         if t.id is None or t.n_clicks is None:
             raise PreventUpdate()
         entry_grp_id = t.id['grp']
-        try:
-            budget = repo.get_budget(budget_idx)
-            idx = next(i for i in range(0, len(budget.expenses)) if budget.expenses[i].id == entry_grp_id)
-            budget.expenses.pop(idx)
+        shown = {x['grp']: data for x, data in zip(table_ids, tables)}
+        with edit_budget(budget_idx) as (budget, change):
+            entry_group = budget.expense_grp_from_id(entry_grp_id)
+            check_unchanged(shown.get(entry_grp_id), entry_group.entries, create_row, entry_group.name)
+            budget.delete(entry_group)
 
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
-            raise PreventUpdate()
+        return change
 
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
@@ -159,12 +161,24 @@ def create_callbacks(app: DashProxy):
     def add_expense_grp(n_clicks: int, budget_idx: str):
         if n_clicks is None:
             raise PreventUpdate()
-        try:
-            budget = repo.get_budget(budget_idx)
-            budget.expenses.append(EntryGroup(name=f"New group"))
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
+        with edit_budget(budget_idx) as (budget, change):
+            budget.add_expense_group(EntryGroup(name=f"New group"))
+        return change
+
+    @app.callback(
+        Output('change-store', 'data', allow_duplicate=True),
+        Trigger(dict(type='add-expense', grp=ALL), 'n_clicks'),
+        State('selected-budget', 'data'),
+        prevent_initial_call=True
+    )
+    def add_expense(budget_idx: str):
+        t = get_triggered()
+        if t.id is None or t.n_clicks is None:
             raise PreventUpdate()
+        with edit_budget(budget_idx) as (budget, change):
+            grp = budget.expense_grp_from_id(t.id['grp'])
+            grp.add_entry(Entry("New entry...", 0, 1, 1, 0, "BS", budget.accounts[0].name if budget.accounts else "Default", "", ""))
+        return change
 
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
@@ -173,6 +187,7 @@ def create_callbacks(app: DashProxy):
         State('selected-budget', 'data'),
         prevent_initial_call=True
     )
+    @rejects_stale_edits
     def update_graphs(budget_idx: str) -> ChangeStoreModel:
 
         t = get_triggered()
@@ -180,43 +195,41 @@ def create_callbacks(app: DashProxy):
             raise PreventUpdate()
 
         entry_grp_id = t.id['grp']
-        try:
-            entry_group = next(x for x in repo.get_budget(budget_idx).expenses if x.id == entry_grp_id)
-        except (StopIteration, BudgetNotFoundError):
-            raise PreventUpdate()
-
-        entries = entry_group.entries
-
         new_data = t.data
         old_data = t.data_previous
 
         if new_data and old_data and new_data != old_data:
-            handle_update(old_data, new_data, entries, entry_group.name)
-            return ChangeStoreModel(budget_idx)
+            with edit_budget(budget_idx) as (budget, change):
+                entry_group = budget.expense_grp_from_id(entry_grp_id)
+                apply_rows(
+                    old_data, new_data, entry_group.entries, Entry, entry_group.delete_entry, entry_group.add_entry,
+                    entry_group.name, create_row
+                )
+            return change
         else:
             raise PreventUpdate()
 
     @app.callback(
         Output('expense-accordion', 'children'),
         Output('expense-accordion', 'value'),
-        Trigger(dict(type='add-expense', grp=ALL), 'n_clicks'),
-        Trigger('change-store', 'data'),
+        Input('change-store', 'data'),
         Input('selected-budget', 'data'),
         State('expense-accordion', 'value')
     )
-    def update_graphs(budget_idx: str, selected):
-        t = get_triggered()
+    def update_graphs(change: ChangeStoreModel, budget_idx: str, selected):
+        # The account column lists the accounts of the budget
+        skip_unaffected(change, EXPENSES, ACCOUNTS)
         try:
-            budget = repo.get_budget(budget_idx)
+            with repo.read(budget_idx) as budget:
+                if get_triggered().id == "change-store" and change.patchable(EXPENSES):
+                    # Only the edited groups are sent to the browser
+                    return patch_groups(
+                        budget.expenses, change.groups, lambda x: create_item(x, budget.accounts)
+                    ), selected
+                return create_table(budget), selected
         except BudgetNotFoundError:
             raise PreventUpdate()
 
-        if isinstance(t.id, dict) and t.id['type'] == 'add-expense':
-            grp = budget.expense_grp_from_id(t.id['grp'])
-            grp.entries.append(Entry("New entry...", 0, 1, 1, 0, "BS", budget.accounts[0].name if budget.accounts else "Default", "", ""))
-
-        return create_table(budget), selected
-
 
 def init(app: DashProxy):
 
@@ -227,15 +240,10 @@ def init(app: DashProxy):
         State('selected-budget', 'data')
     )
     def on_modal_input(value, who, budget_idx: str):
-        try:
-            budget = repo.get_budget(budget_idx)
-            expense_grp = budget.expense_grp_from_id(who['grp'])
-
-            expense_grp.name = value
+        with edit_budget(budget_idx) as (budget, change):
+            budget.expense_grp_from_id(who['grp']).name = value
 
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
-            raise PreventUpdate()
+        return change
 
     create_callbacks(app)
     return html.Div([
@@ -1,5 +1,115 @@
+import dataclasses
+import functools
 import logging
+import typing
+from contextlib import contextmanager
+from typing import Optional
+
 import dash_mantine_components as dmc
+import numpy as np
+from dash import Patch
+from dash.development.base_component import Component
+from dash.exceptions import PreventUpdate
+from dash_extensions.snippets import get_triggered
+from plotly.basedatatypes import BaseFigure
+
+from finance.model.entry import GroupNotFoundError
+from finance.utils.memo import Memo
+from finance.webapp.models import ChangeStoreModel, record_changes
+from finance.webapp.state import repo, BudgetNotFoundError, StaleBudgetError
+
+
+def _rendered_size(output) -> int:
+    # A rough estimate of the size of the output as it is sent to the browser. Serializing the output only to measure
+    # it would double the cost of every miss, so each component counts a fixed amount plus the rows of its tables,
+    # and each figure a fixed amount plus its points.
+    size = 0
+    stack = [output]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, (list, tuple)):
+            stack.extend(x)
+        elif isinstance(x, Component):
+            size += 100
+            for name in ("data", "elements"):
+                rows = getattr(x, name, None)
+                if isinstance(rows, list):
+                    size += 24 * sum(len(row) for row in rows)
+            children = getattr(x, "children", None)
+            if children is not None:
+                stack.append(children)
+        elif isinstance(x, BaseFigure):
+            # The traces as plain dicts, which unlike Figure.data are not wrapped and validated on access
+            size += 4000 + sum(
+                24 * len(v) for trace in x._data for v in trace.values() if isinstance(v, (list, tuple, np.ndarray))
+            )
+        elif isinstance(x, str):
+            size += len(x)
+    return size
+
+
+# Components and figures built from a budget, keyed by its id and version, so switching between budgets and tabs
+# serves them without rebuilding
+render_cache = Memo(maxsize=512, maxbytes=64 * 1024 * 1024, sizeof=_rendered_size)
+
+
+def skip_unaffected(change: ChangeStoreModel, *scopes: str):
+    """
+    Raises PreventUpdate when the callback is triggered by a change which does not affect any of the scopes the
+    panel depends on.
+    """
+    if change is not None and get_triggered().id == "change-store" and not change.affects(*scopes):
+        raise PreventUpdate()
+
+
+class EditConflictError(Exception):
+    """
+    Raised by `apply_rows` when a cell is edited which has been changed by someone else since the client got it.
+    """
+
+
+@contextmanager
+def edit_budget(budget_idx: str):
+    """
+    Yields the budget, locked for writing, and a ChangeStoreModel recording the changes made to it in a batch. An
+    EditConflictError raised by the edit is raised as a StaleBudgetError, see `rejects_stale_edits`.
+    """
+    try:
+        with repo.write(budget_idx) as budget:
+            with record_changes(budget, budget_idx) as change, budget.batch():
+                yield budget, change
+    except (GroupNotFoundError, BudgetNotFoundError):
+        # The budget, or the group which is edited, has been deleted
+        raise PreventUpdate()
+    except EditConflictError as exc:
+        raise StaleBudgetError(budget_idx, repo.version(budget_idx)) from exc
+
+
+def rejects_stale_edits(callback):
+    """
+    Decorates a callback which edits a budget with `edit_budget`. An edit which conflicts with changes the client
+    has not seen is not applied, and every panel is updated instead, so the client is shown the changes it missed.
+    """
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        try:
+            return callback(*args, **kwargs)
+        except StaleBudgetError as exc:
+            logging.info(f"Rejected edit: {exc}")
+            return ChangeStoreModel(exc.budget_idx)
+    return wrapper
+
+
+def patch_groups(entry_groups, group_ids, create_item) -> Patch:
+    """
+    Patch of accordion children which only replaces the items of the given groups, so the size of the response
+    does not grow with the number of groups.
+    """
+    patch = Patch()
+    for idx, entry_group in enumerate(entry_groups):
+        if entry_group.id in group_ids:
+            patch[idx] = create_item(entry_group)
+    return patch
 
 
 def create_add_btn(_id: dict | str):
@@ -9,21 +119,111 @@ def create_add_btn(_id: dict | str):
     )
 
 
-def handle_update(old_data, new_data, entries, grp_name):
+@functools.lru_cache(maxsize=None)
+def _coercers(cls) -> dict:
+    # The function converting a cell value to the type of each field of the dataclass. The id is never edited.
+    hints = typing.get_type_hints(cls)
+    coercers = {}
+    for f in dataclasses.fields(cls):
+        if f.name != "id":
+            tp = hints[f.name]
+            coercers[f.name] = tp if isinstance(tp, type) else (lambda x: x)
+    return coercers
+
+
+def _coerce(coercers: dict, row: dict) -> dict:
+    values = {}
+    for key, value in row.items():
+        coerce = coercers.get(key)
+        # Columns which are not fields of the dataclass, e.g. computed ones, are ignored
+        if coerce is not None:
+            try:
+                values[key] = coerce(value)
+            except (TypeError, ValueError):
+                logging.warning(f"Ignored invalid value {value!r} for {key}")
+    return values
+
+
+def check_unchanged(rows: Optional[list], items: list, row, label: str = ""):
+    """
+    Raises an EditConflictError when the rows of a table, as the client has them, no longer match the objects they
+    are created from by `row`, because someone else has changed the objects in the meantime. Used before e.g. a
+    group is deleted, so changes the client has not seen are not deleted along with it. Nothing is checked when the
+    client does not have the table.
+    """
+    if rows is None:
+        return
+    # Compared by id, as the client can sort the rows
+    if {x.get("id"): x for x in rows} != {x.id: row(x) for x in items}:
+        raise EditConflictError(f"{label} has been changed")
+
+
+def apply_rows(old_data: list, new_data: list, items: list, cls, delete, add=None, label: str = "", row=None):
+    """
+    Applies the edits of a DataTable to the objects its rows are created from. Rows are matched to the objects by
+    their id, so edits of sorted or filtered tables and pastes into several rows and cells are applied in one pass.
+    Rows which disappear are deleted, and rows without a known id are created with `add`, if given.
+
+    Values are converted to the types of the fields of `cls`. Call it within a `Budget.batch` to apply the changes
+    as one.
+
+    The old rows are what the client had before the edit, so an edited cell whose object no longer has the old value
+    has been changed by someone else in the meantime. The edit is then rejected as a whole with an
+    EditConflictError, unless the object already has the new value. The same goes for an edited row whose object
+    has been deleted. Other changes made since, e.g. to other cells or rows, do not conflict. When the table shows
+    other values than the fields of the objects, `row` creates the row of an object as it is shown, which the old
+    rows are compared with instead.
+    """
     if old_data is None or new_data is None:
         return
 
-    if len(new_data) < len(old_data):
-        new_data_names = [x['id'] for x in new_data]
-        for x in entries:
-            if x.id not in new_data_names:
-                entries.remove(x)
-                logging.debug(f"Expense: Removed {x.name} ({grp_name})")
-    else:
-        for idx, (new_row, old_row) in enumerate(zip(new_data, old_data)):
-            for key, val in new_row.items():
-                if val != old_row[key]:
-                    entry = entries[idx]
-                    setattr(entry, key, type(old_row[key])(new_row[key]))
-                    logging.debug(
-                        f"Expense: Changed {key} from {old_row[key]} to {new_row[key]} in {entry.name} ({grp_name})")
\ No newline at end of file
+    by_id = {x.id: x for x in items}
+    old_rows = {row.get("id"): row for row in old_data}
+    coercers = _coercers(cls)
+
+    new_ids = set()
+    added = []
+    edits = []
+    for new_row in new_data:
+        _id = new_row.get("id")
+        new_ids.add(_id)
+        item = by_id.get(_id)
+        old_row = old_rows.get(_id)
+        if item is None:
+            if old_row is not None:
+                # The row of an object which has been deleted in the meantime, which is not brought back
+                if new_row != old_row:
+                    raise EditConflictError(f"{old_row.get('name')} ({label}) was deleted")
+            elif add is not None:
+                try:
+                    added.append(cls(**_coerce(coercers, new_row)))
+                except TypeError:
+                    logging.warning(f"Ignored incomplete row {new_row} ({label})")
+            continue
+
+        if old_row is None or new_row == old_row:
+            continue
+        changed = {key: value for key, value in new_row.items() if old_row.get(key) != value}
+        old_values = _coerce(coercers, {key: old_row[key] for key in changed if key in old_row})
+        shown = _coerce(coercers, row(item)) if row is not None else None
+        for key, value in _coerce(coercers, changed).items():
+            if getattr(item, key) == value:
+                continue
+            current = shown[key] if shown is not None else getattr(item, key)
+            if key in old_values and current != old_values[key]:
+                raise EditConflictError(f"{key} of {item.name} ({label}) was changed to {current}")
+            edits.append((item, key, value))
+
+    # Applied once every cell is checked, so a conflicting edit changes nothing
+    for item in added:
+        add(item)
+        logging.debug(f"Added {item.name} ({label})")
+    for item, key, value in edits:
+        setattr(item, key, value)
+        logging.debug(f"Changed {key} to {value} in {item.name} ({label})")
+
+    for _id in old_rows.keys() - new_ids:
+        item = by_id.get(_id)
+        if item is not None:
+            delete(item)
+            logging.debug(f"Removed {item.name} ({label})")
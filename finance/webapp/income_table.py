@@ -10,19 +10,21 @@ from dash_extensions.enrich import html, Output, DashProxy, Trigger, Input, Stat
 import dash_mantine_components as dmc
 from dash_extensions.enrich import dash_table
 
-from finance.webapp.helpers import handle_update, create_add_btn
+from finance.webapp.helpers import apply_rows, create_add_btn, render_cache, skip_unaffected, patch_groups, \
+    edit_budget, rejects_stale_edits, check_unchanged
 from finance.webapp.modal_input import ModalInput
-from finance.webapp.models import ChangeStoreModel
+from finance.webapp.models import ChangeStoreModel, INCOMES, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 
+def create_row(x: Entry) -> dict:
+    _e = asdict(x)
+    _e["monthly"] = f"{x.monthly():0.2f}"
+    return _e
+
+
 def create_data_table_data(entry_group: EntryGroup):
-    data = []
-    for x in entry_group.entries:
-        _e = asdict(x)
-        _e["monthly"] = f"{x.monthly():0.2f}"
-        data.append(_e)
-    return data
+    return [create_row(x) for x in entry_group.entries]
 
 
 def create_data_table(entry_group: EntryGroup, budget: Budget):
@@ -61,37 +63,35 @@ def create_data_table(entry_group: EntryGroup, budget: Budget):
     )
 
 
-def create_table(budget: Budget):
-
-    children = []
-    for entry_group in budget.incomes:
-        children.append(
-            dmc.AccordionItem([
-                dmc.AccordionControl(
-                    [
-                        dmc.Grid([
-                            dmc.Col(entry_group.name, span=10),
-                            dmc.Col(dmc.Text(f"{entry_group.total_monthly():0.2f}", align="right"), span=2)
-                        ])
-                    ]
-                ),
-                dmc.AccordionPanel([
-                    dmc.Group([
-                        dmc.Button(
-                            "Tilføj", id=dict(type="add-income", grp=entry_group.id),
-                            size="xs", mb="5px", variant="outline"
-                        ),
-                        dmc.Button("Omdøb", id=dict(type="rename-income", grp=entry_group.id), size="xs", mb="5px",
-                                   variant="outline", color="green"),
-                        dmc.Button("Delete", id=dict(type="delete-income", grp=entry_group.id), size="xs", mb="5px",
-                                   variant="outline", color="red")
-                    ], position="right"),
-                    create_data_table(entry_group, budget)
+def create_item(entry_group: EntryGroup, budget: Budget):
+    return dmc.AccordionItem([
+        dmc.AccordionControl(
+            [
+                dmc.Grid([
+                    dmc.Col(entry_group.name, span=10),
+                    dmc.Col(dmc.Text(f"{entry_group.total_monthly():0.2f}", align="right"), span=2)
                 ])
-            ], value=entry_group.id)
-        )
+            ]
+        ),
+        dmc.AccordionPanel([
+            dmc.Group([
+                dmc.Button(
+                    "Tilføj", id=dict(type="add-income", grp=entry_group.id),
+                    size="xs", mb="5px", variant="outline"
+                ),
+                dmc.Button("Omdøb", id=dict(type="rename-income", grp=entry_group.id), size="xs", mb="5px",
+                           variant="outline", color="green"),
+                dmc.Button("Delete", id=dict(type="delete-income", grp=entry_group.id), size="xs", mb="5px",
+                           variant="outline", color="red")
+            ], position="right"),
+            create_data_table(entry_group, budget)
+        ])
+    ], value=entry_group.id)
 
-    return children
+
+@render_cache
+def create_table(budget: Budget):
+    return [create_item(entry_group, budget) for entry_group in budget.incomes]
 
 
 def create_callbacks(app: DashProxy):
@@ -99,23 +99,25 @@ def create_callbacks(app: DashProxy):
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
         Trigger(dict(type="delete-income", grp=ALL), 'n_clicks'),
-        State('selected-budget', 'data')
+        State('selected-budget', 'data'),
+        State(dict(type='incomes-table', grp=ALL), 'id'),
+        State(dict(type='incomes-table', grp=ALL), 'data')
     )
-    def delete_income_group(budget_idx: str):
+    @rejects_stale_edits
+    def delete_income_group(budget_idx: str, table_ids: list, tables: list):
 
         t = get_triggered()
         if t.id is None or t.n_clicks is None:
             raise PreventUpdate()
         entry_grp_id = t.id['grp']
+        shown = {x['grp']: data for x, data in zip(table_ids, tables)}
 
-        try:
-            budget = repo.get_budget(budget_idx)
-            idx = next(i for i in range(0, len(budget.incomes)) if budget.incomes[i].id == entry_grp_id)
-            budget.incomes.pop(idx)
+        with edit_budget(budget_idx) as (budget, change):
+            entry_group = budget.income_grp_from_id(entry_grp_id)
+            check_unchanged(shown.get(entry_grp_id), entry_group.entries, create_row, entry_group.name)
+            budget.delete(entry_group)
 
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
-            raise PreventUpdate()
+        return change
 
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
@@ -126,12 +128,24 @@ def create_callbacks(app: DashProxy):
     def add_income_grp(n_clicks: int, budget_idx: str):
         if n_clicks is None:
             raise PreventUpdate()
-        try:
-            budget = repo.get_budget(budget_idx)
-            budget.incomes.append(EntryGroup(name=f"New group"))
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
+        with edit_budget(budget_idx) as (budget, change):
+            budget.add_incomes_group(EntryGroup(name=f"New group"))
+        return change
+
+    @app.callback(
+        Output('change-store', 'data', allow_duplicate=True),
+        Trigger(dict(type='add-income', grp=ALL), 'n_clicks'),
+        State('selected-budget', 'data'),
+        prevent_initial_call=True
+    )
+    def add_income(budget_idx: str):
+        t = get_triggered()
+        if t.id is None or t.n_clicks is None:
             raise PreventUpdate()
+        with edit_budget(budget_idx) as (budget, change):
+            grp = budget.income_grp_from_id(t.id['grp'])
+            grp.add_entry(Entry("New entry...", 0, 1, 1, 0, "BS", budget.accounts[0].name, "", ""))
+        return change
 
     @app.callback(
         Output('change-store', 'data', allow_duplicate=True),
@@ -140,6 +154,7 @@ def create_callbacks(app: DashProxy):
         State('selected-budget', 'data'),
         prevent_initial_call=True
     )
+    @rejects_stale_edits
     def update_graphs(budget_idx: str) -> ChangeStoreModel:
 
         t = get_triggered()
@@ -147,40 +162,31 @@ def create_callbacks(app: DashProxy):
             raise PreventUpdate()
 
         entry_grp_id = t.id['grp']
-        try:
-            entry_group = next(x for x in repo.get_budget(budget_idx).incomes if x.id == entry_grp_id)
-        except (StopIteration, BudgetNotFoundError):
-            raise PreventUpdate()
-
-        entries = entry_group.entries
-
         new_data = t.data
         old_data = t.data_previous
         if new_data and old_data and new_data != old_data:
-            handle_update(old_data, new_data, entries, entry_grp_id)
-            return ChangeStoreModel(budget_idx)
+            with edit_budget(budget_idx) as (budget, change):
+                entry_group = budget.income_grp_from_id(entry_grp_id)
+                apply_rows(old_data, new_data, entry_group.entries, Entry, entry_group.delete_entry, entry_group.add_entry, entry_group.name)
+            return change
         else:
             raise PreventUpdate()
 
     @app.callback(
         Output('income-accordion', 'children'),
         Output('income-accordion', 'value'),
-        Trigger(dict(type='add-income', grp=ALL), 'n_clicks'),
-        Trigger('change-store', 'data'),
+        Input('change-store', 'data'),
         Input('selected-budget', 'data'),
         State('income-accordion', 'value')
     )
-    def update_graphs(budget_idx: str, selected):
+    def update_graphs(change: ChangeStoreModel, budget_idx: str, selected):
+        skip_unaffected(change, INCOMES, ACCOUNTS)
         try:
-            t = get_triggered()
-            budget = repo.get_budget(budget_idx)
-
-            if isinstance(t.id, dict) and t.id['type'] == 'add-income':
-                entry_grp_id = t.id['grp']
-                grp = next(x for x in budget.incomes if x.id == entry_grp_id)
-                grp.entries.append(Entry("New entry...", 0, 1, 1, 0, "BS", budget.accounts[0].name, "", ""))
-
-            return create_table(budget), selected
+            with repo.read(budget_idx) as budget:
+                if get_triggered().id == "change-store" and change.patchable(INCOMES):
+                    # Only the edited groups are sent to the browser
+                    return patch_groups(budget.incomes, change.groups, lambda x: create_item(x, budget)), selected
+                return create_table(budget), selected
         except BudgetNotFoundError:
             raise PreventUpdate()
 
@@ -193,15 +199,10 @@ def init(app: DashProxy):
         State('selected-budget', 'data')
     )
     def on_modal_input(value, who, budget_idx: str):
-        try:
-            budget = repo.get_budget(budget_idx)
-            income_grp = next(x for x in budget.incomes if x.id == who['grp'])
-
-            income_grp.name = value
+        with edit_budget(budget_idx) as (budget, change):
+            budget.income_grp_from_id(who['grp']).name = value
 
-            return ChangeStoreModel()
-        except BudgetNotFoundError:
-            raise PreventUpdate()
+        return change
 
     create_callbacks(app)
     return html.Div([
@@ -1,5 +1,18 @@
+from contextlib import contextmanager
 from uuid import uuid4
 from dataclasses import dataclass, field
+from typing import List, Optional
+
+from finance.model.entry import Budget, Entry, EntryGroup, Transfer, Account
+from finance.model.frame import EXPENSE
+
+# What a change can affect. Panels declare which of these they depend on.
+EXPENSES = "expenses"
+INCOMES = "incomes"
+TRANSFERS = "transfers"
+ACCOUNTS = "accounts"
+LAYOUT = "layout"
+BUDGET = "budget"
 
 
 @dataclass
@@ -7,3 +20,62 @@ class ChangeStoreModel:
 
     budget_idx: str = None
     correlation: str = field(default_factory=lambda: str(uuid4()))
+    # The scopes affected by the change, or None when everything may have changed, e.g. when another budget is
+    # selected
+    scopes: Optional[List[str]] = None
+    # The ids of the expense and income groups which changed, or None when groups were added or removed
+    groups: Optional[List[str]] = field(default_factory=list)
+
+    def affects(self, *scopes: str) -> bool:
+        return self.scopes is None or any(x in self.scopes for x in scopes)
+
+    def _add(self, scope: str, entry_group: Optional[EntryGroup] = None):
+        if scope not in self.scopes:
+            self.scopes.append(scope)
+        if entry_group is not None and self.groups is not None and entry_group.id not in self.groups:
+            self.groups.append(entry_group.id)
+
+    def patchable(self, scope: str) -> bool:
+        """
+        Whether the change only edits existing groups of the scope, so their items can be patched in place.
+        """
+        return self.scopes == [scope] and self.groups is not None
+
+
+def _group_scope(budget: Budget, entry_group: EntryGroup) -> str:
+    return EXPENSES if budget.group_kind(entry_group) == EXPENSE else INCOMES
+
+
+@contextmanager
+def record_changes(budget: Budget, budget_idx: str = None):
+    """
+    Yields a ChangeStoreModel which collects the scopes and groups affected by the changes made to the budget
+    inside the block.
+    """
+    change = ChangeStoreModel(budget_idx or budget.id, scopes=[])
+
+    def on_change(op, obj, name, value):
+        if isinstance(obj, Budget):
+            if op != "set":
+                change._add(name)
+                if name in (EXPENSES, INCOMES):
+                    change.groups = None
+            elif name == "extra":
+                change._add(LAYOUT)
+            elif name == "budget_accounts":
+                change._add(ACCOUNTS)
+            else:
+                change._add(BUDGET)
+        elif isinstance(obj, (Entry, EntryGroup)):
+            entry_group = obj if isinstance(obj, EntryGroup) else obj._parent
+            change._add(_group_scope(budget, entry_group), entry_group)
+        elif isinstance(obj, Transfer):
+            change._add(TRANSFERS)
+        elif isinstance(obj, Account):
+            change._add(ACCOUNTS)
+
+    budget.register_on_change(on_change)
+    try:
+        yield change
+    finally:
+        budget.unregister_on_change(on_change)
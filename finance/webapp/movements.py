@@ -1,22 +1,28 @@
 from datetime import datetime
 
 from dash.exceptions import PreventUpdate
-from dash_extensions.enrich import DashProxy, Trigger, Output, html, Input
+from dash_extensions.enrich import DashProxy, Output, html, Input
 
 from finance.model.entry import Budget
 import dash_mantine_components as dmc
 from finance.utils.monthly_overview import get_monthly_movements, MONTHS
+from finance.webapp.helpers import render_cache, skip_unaffected
+from finance.webapp.models import ChangeStoreModel, EXPENSES, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 
 def create_movements(budget: Budget, quarter: int = None):
-
-    monthly_payments = get_monthly_movements(budget, "Budget", range(1, 13))
-
     if quarter is None:
         quarter = datetime.now().month // 3 - 1
+    return _create_movements(budget, quarter)
+
+
+@render_cache
+def _create_movements(budget: Budget, quarter: int):
     months = [quarter * 3 + 1, quarter * 3 + 2, quarter * 3 + 3]
-    size = max(len(monthly_payments[x]) for x in months)
+
+    monthly_payments = get_monthly_movements(budget, "Budget", months)
+    size = max(len(monthly_payments.get(x, ())) for x in months)
 
     children = [
         dmc.Col([
@@ -47,7 +53,8 @@ def create_movements(budget: Budget, quarter: int = None):
         ]
 
         rows = []
-        for x in sorted(monthly_payments[month], key=lambda _x: (_x.payment_period, _x.name)):
+        # Already sorted by payment period and name
+        for x in monthly_payments.get(month, ()):
             rows.append(html.Tr([
                 html.Td(x.name, style={"font-size": "12px"}),
                 html.Td(x.payment_size, style={"text-align": "right", "font-size": "12px"}),
@@ -57,11 +64,11 @@ def create_movements(budget: Budget, quarter: int = None):
         rows += [html.Tr([
             html.Td("-"),
             html.Td("-", style={"text-align": "right"})
-        ]) for _ in range(size - len(monthly_payments[month]))]
+        ]) for _ in range(size - len(monthly_payments.get(month, ())))]
 
         rows.append(html.Tr([
             html.Td(dmc.Text("Total", weight=700)),
-            html.Td(dmc.Text(sum(x.payment_size for x in monthly_payments[month]), weight=700), style={"text-align": "right"})
+            html.Td(dmc.Text(sum(x.payment_size for x in monthly_payments.get(month, ())), weight=700), style={"text-align": "right"})
         ]))
 
         body = [html.Tbody(rows)]
@@ -84,12 +91,14 @@ def init(app: DashProxy):
     @app.callback(
         Input("selected-budget", "data"),
         Input("selected-block", "data"),
-        Trigger("change-store", "data"),
+        Input("change-store", "data"),
         Output("movements", "children")
     )
-    def _on_change(budget_idx: str, block: int):
+    def _on_change(budget_idx: str, block: int, change: ChangeStoreModel):
+        skip_unaffected(change, EXPENSES, ACCOUNTS)
         try:
-            return [create_movements(repo.get_budget(budget_idx), block)]
+            with repo.read(budget_idx) as budget:
+                return [create_movements(budget, block)]
         except BudgetNotFoundError:
             raise PreventUpdate()
 
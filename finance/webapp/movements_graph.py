@@ -3,11 +3,12 @@ from typing import Optional
 
 from dash import html
 from dash.exceptions import PreventUpdate
-from dash_extensions.enrich import DashProxy, Trigger, Output, Input, State
+from dash_extensions.enrich import DashProxy, Output, Input, State
 from finance.model.entry import Budget
 import dash_cytoscape as cyto
 
-from finance.webapp.models import ChangeStoreModel
+from finance.webapp.helpers import render_cache, skip_unaffected, edit_budget
+from finance.webapp.models import ChangeStoreModel, EXPENSES, INCOMES, TRANSFERS, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 
@@ -30,6 +31,7 @@ class Node:
         self.tag: str = tag
 
 
+@render_cache
 def create_figure(budget: Budget):
 
     graph: dict[str, Node] = {}
@@ -80,12 +82,9 @@ def create_figure(budget: Budget):
 
     height = 5 * dh
 
-    expense_balances, income_balances, transfer_balances = budget.calculate_balances()
-
     balance = {}
     for account in budget.accounts:
-        balance[account.name] = income_balances[account.name] + transfer_balances[
-            account.name] + expense_balances[account.name]
+        balance[account.name] = budget.balance(account.name)[1]
 
     for level in sorted(nodes):
         n_nodes = len(nodes[level])
@@ -178,25 +177,23 @@ def init(app: DashProxy):
             if 'position' in x:
                 state[x['data']['id']] = x.get("position")
 
-        try:
-            budget = repo.get_budget(budget_idx)
-
+        with edit_budget(budget_idx) as (budget, change):
             if state == budget.extra.get("account-layout"):
                 raise PreventUpdate()
-
             budget.add_extra("account-layout", state)
-            return ChangeStoreModel(budget_idx)
-        except BudgetNotFoundError:
-            raise PreventUpdate()
+        return change
 
     @app.callback(
         Input('selected-budget', 'data'),
-        Trigger("change-store", "data"),
+        Input("change-store", "data"),
         Output("movements-graph", "children")
     )
-    def _on_change(budget_idx: str):
+    def _on_change(budget_idx: str, change: ChangeStoreModel):
+        # Moving the accounts around only changes the layout, which the graph already shows
+        skip_unaffected(change, EXPENSES, INCOMES, TRANSFERS, ACCOUNTS)
         try:
-            return create_figure(repo.get_budget(budget_idx))
+            with repo.read(budget_idx) as budget:
+                return create_figure(budget)
         except BudgetNotFoundError:
             raise PreventUpdate()
 
@@ -1,19 +1,23 @@
 from dash.exceptions import PreventUpdate
-from dash_extensions.enrich import DashProxy, Trigger, dcc, Output, Input
+from dash_extensions.enrich import DashProxy, dcc, html, Output, Input
 from finance.model.entry import Budget
+import dash_mantine_components as dmc
 
 
 import plotly.graph_objects as go
 
 from finance.utils.monthly_overview import monthly, expected_saldo
 from finance.webapp.state import repo, BudgetNotFoundError
+from finance.webapp.helpers import render_cache, skip_unaffected
+from finance.webapp.models import ChangeStoreModel, EXPENSES, TRANSFERS, ACCOUNTS
 
 
-def create_figure(budget: Budget):
+@render_cache
+def create_figure(budget: Budget, account: str = "Budget"):
 
     months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Okt', 'Nov', 'Dec']
 
-    monthly_expenses, monthly_incomes = monthly(budget, "Budget")
+    monthly_expenses, monthly_incomes = monthly(budget, account)
 
     saldos = expected_saldo(monthly_expenses)
 
@@ -32,13 +36,20 @@ def init(app: DashProxy):
 
     @app.callback(
         Input('selected-budget', 'data'),
-        Trigger("change-store", "data"),
-        Output("saldo-graph", "figure")
+        Input('saldo-account', 'value'),
+        Input("change-store", "data"),
+        Output("saldo-graph", "figure"),
+        Output("saldo-account", "data")
     )
-    def _on_change(budget_idx: str):
+    def _on_change(budget_idx: str, account: str, change: ChangeStoreModel):
+        skip_unaffected(change, EXPENSES, TRANSFERS, ACCOUNTS)
         try:
-            return create_figure(repo.get_budget(budget_idx))
+            with repo.read(budget_idx) as budget:
+                return create_figure(budget, account or "Budget"), [x.name for x in budget.accounts]
         except BudgetNotFoundError:
             raise PreventUpdate()
 
-    return dcc.Graph(id="saldo-graph")
+    return html.Div([
+        dmc.Select(id="saldo-account", value="Budget", data=[], size="xs", mt="sm"),
+        dcc.Graph(id="saldo-graph")
+    ])
@@ -1,51 +1,436 @@
+import functools
+import logging
 import os
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, asdict
 from pathlib import Path
+from typing import Dict, List, Optional
 from uuid import uuid4
 
+from finance.model.codec import Codec, codec_for, is_budget_file
+from finance.model.database import BudgetDatabase, VersionStamps
 from finance.model.entry import Budget
+from finance.model.journal import Journal
+from finance.utils.locks import FileLock, ReadWriteLock
+
+MANIFEST_NAME = ".manifest"
+VERSIONS_NAME = ".versions"
+MANIFEST_LOCK_NAME = ".manifest.lock"
 
 
 class BudgetNotFoundError(Exception):
     pass
 
 
-class BudgetRepository:
+class StaleBudgetError(Exception):
+    """
+    Raised when a budget is edited based on a state of it which is no longer the current one.
+    """
+
+    def __init__(self, budget_idx: str, version: int):
+        super().__init__(f"Budget {budget_idx} has changed, it is now at version {version}")
+        self.budget_idx = budget_idx
+        self.version = version
+
+
+def _synchronized(method):
+    # The loaded budgets and their bookkeeping are shared by the threads of the server
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@dataclass
+class BudgetInfo:
+
+    id: str
+    name: str
+    path: str
+    mtime: float
+    size: int = 0
+
+
+class _SharedVersions:
+    """
+    Keeps the budgets loaded by this process coherent with the changes made by other processes, e.g. the other
+    workers of the web server. Each change bumps the version stamp of the budget in `stamps`, and a loaded budget
+    whose stamp has been bumped by another process is stale and is loaded again.
+
+    Within the process, the threads of the server use a budget through `read` and `write`, which hold a reader/writer
+    lock of the budget. Renders of the same budget run in parallel, while an edit has the budget to itself. The
+    changes made in a `write` block bump the stamp once, when the block ends or `flush` is called, rather than once
+    per change, as each bump is a write transaction on the stamps shared by all processes. Until then, the other
+    processes take their copy of the budget as current, so a `write` block also holds `_process_lock`, which keeps
+    them from acting on that, e.g. by emptying a journal the changes have been appended to.
+    """
+
+    def __init__(self, stamps: VersionStamps):
+        self.stamps = stamps
+        self._lock = threading.RLock()
+        self._budget_locks: Dict[str, ReadWriteLock] = {}
+        # The stamp of each loaded budget as of its load or last change in this process. None when another process
+        # changed it at the same time, so it must be loaded again.
+        self._seen: Dict[str, Optional[int]] = {}
+        self._listeners = {}
+        # Whether the budgets in a write block have been changed in it
+        self._writing: Dict[str, bool] = {}
+        self._catalog = stamps.get(VersionStamps.CATALOG)
+
+    def _track(self, budget: Budget, stamp: int):
+        def on_change(op, obj, name, value):
+            if budget.id in self._writing:
+                self._writing[budget.id] = True
+            else:
+                self._bump(budget.id)
+
+        self._untrack(budget.id)
+        self._seen[budget.id] = stamp
+        self._listeners[budget.id] = (budget, on_change)
+        budget.register_on_change(on_change)
+
+    def _bump(self, idx: str):
+        new, current = self.stamps.bump(idx, self._seen.get(idx))
+        self._seen[idx] = new if current else None
+
+    def _process_lock(self, idx: str):
+        # The lock of the budget shared by all processes, if the changes of one can be lost by another
+        return nullcontext()
+
+    def _untrack(self, idx: str):
+        self._seen.pop(idx, None)
+        budget, on_change = self._listeners.pop(idx, (None, None))
+        if budget is not None:
+            budget.unregister_on_change(on_change)
+
+    def _is_current(self, idx: str) -> bool:
+        return self._seen.get(idx) == self.stamps.get(idx)
+
+    def _catalog_changed(self) -> bool:
+        catalog = self.stamps.get(VersionStamps.CATALOG)
+        changed, self._catalog = catalog != self._catalog, catalog
+        return changed
 
-    def __init__(self, parent_directory: str | Path):
-        self.budgets = {}
+    def _bump_catalog(self):
+        self._catalog, _ = self.stamps.bump(VersionStamps.CATALOG)
+
+    def _budget_lock(self, idx: str) -> ReadWriteLock:
+        with self._lock:
+            try:
+                return self._budget_locks[idx]
+            except KeyError:
+                lock = self._budget_locks[idx] = ReadWriteLock()
+                return lock
+
+    def version(self, idx: str) -> int:
+        """
+        The version of the budget, shared by all processes and bumped by every change.
+        """
+        return self.stamps.get(idx)
+
+    @contextmanager
+    def read(self, idx: str):
+        """
+        Yields the budget, which is not changed by other threads until the block ends.
+        """
+        with self._budget_lock(idx).read():
+            yield self.get_budget(idx)
+
+    @contextmanager
+    def write(self, idx: str):
+        """
+        Yields the budget, which no other thread uses until the block ends.
+        """
+        with self._budget_lock(idx).write(), self._process_lock(idx):
+            self._writing[idx] = False
+            try:
+                yield self.get_budget(idx)
+            finally:
+                self.flush(idx)
+                del self._writing[idx]
+
+    def flush(self, idx: str) -> int:
+        """
+        Bumps the version of a budget changed in the current write block, so other processes see the changes. Returns
+        the version of the budget.
+        """
+        if self._writing.get(idx):
+            self._writing[idx] = False
+            self._bump(idx)
+        return self.stamps.get(idx)
+
+
+class BudgetRepository(_SharedVersions):
+    """
+    Budgets stored as files in a directory. Only the metadata of the budgets is read when the repository is created,
+    and it is cached in a manifest file in the directory. A budget is loaded on the first `get_budget`.
+
+    Changes to a loaded budget are written to its journal as they happen, and the budget file is only written when
+    the budget is saved. Several processes can share the directory, see `_SharedVersions`. A budget is loaded, saved
+    and edited while holding the lock of its journal, see `Journal`, so a process never empties a journal which has
+    records it does not know about.
+    """
+
+    def __init__(self, parent_directory: str | Path, file_format: str = ".json"):
+        self.budgets: Dict[str, Budget] = {}
+        self.journals: Dict[str, Journal] = {}
+        self.manifest: Dict[str, BudgetInfo] = {}
         self.parent_directory = Path(parent_directory)
+        # The format new budgets are saved in, e.g. ".json", ".msgpack" or ".json.gz"
+        self.codec = codec_for(f"budget{file_format}")
+        self._file_locks: Dict[Path, FileLock] = {}
+        # Held while the manifest is read and written, so the workers of the server do not write it at the same time
+        self._manifest_lock = FileLock(self.parent_directory / MANIFEST_LOCK_NAME)
         self._load_directory()
+        super().__init__(VersionStamps(self.parent_directory / VERSIONS_NAME))
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.parent_directory / MANIFEST_NAME
+
+    def _read_manifest(self) -> Dict[str, BudgetInfo]:
+        try:
+            return {x["path"]: BudgetInfo(**x) for x in Codec().read(self.manifest_path)}
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            logging.warning(f"Could not read budget manifest {self.manifest_path}", exc_info=exc)
+            return {}
+
+    def _write_manifest(self):
+        with self._manifest_lock:
+            Codec().write(self.manifest_path, [asdict(x) for x in self.manifest.values()])
 
     def _load_directory(self):
-        self.budgets = {}
-        if not self.parent_directory.exists():
-            self.parent_directory.mkdir()
-        for file in self.parent_directory.iterdir():
-            if file.suffix == ".json":
-                budget = Budget.load(str(file))
-                self.budgets[budget.id] = budget
+        self.manifest = {}
+        self.parent_directory.mkdir(exist_ok=True)
+
+        with self._manifest_lock:
+            cached = self._read_manifest()
+            changed = False
+            for file in self.parent_directory.iterdir():
+                if not is_budget_file(file):
+                    continue
+                stat = file.stat()
+                info = cached.pop(str(file), None)
+                if info is None or info.mtime != stat.st_mtime or info.size != stat.st_size:
+                    data = codec_for(file).read(file)
+                    info = BudgetInfo(data["id"], data["name"], str(file), stat.st_mtime, stat.st_size)
+                    changed = True
+                self.manifest[info.id] = info
+
+            if changed or cached:
+                self._write_manifest()
+
+    @_synchronized
+    def list_budgets(self) -> List[BudgetInfo]:
+        if self._catalog_changed():
+            self._load_directory()
+        return list(self.manifest.values())
+
+    @_synchronized
+    def _file_lock(self, path: Path) -> FileLock:
+        # One lock per file, shared by the threads of the process, as the lock is per open file
+        try:
+            return self._file_locks[path]
+        except KeyError:
+            lock = self._file_locks[path] = FileLock(path)
+            return lock
+
+    @_synchronized
+    def _info(self, idx: str) -> BudgetInfo:
+        info = self.manifest.get(idx)
+        if info is None and self._catalog_changed():
+            # Created by another process
+            self._load_directory()
+            info = self.manifest.get(idx)
+        if info is None:
+            raise BudgetNotFoundError()
+        return info
+
+    def _process_lock(self, idx: str) -> FileLock:
+        return self._file_lock(Journal.path_for(self._info(idx).path))
+
+    def _create_journal(self, idx: str, path: Path) -> Journal:
+        # A stale budget must not be compacted, as that would drop the changes of other processes from the journal
+        journal = self.journals[idx] = Journal(
+            Journal.path_for(path), budget_path=path, can_compact=lambda: self._is_current(idx),
+            lock=self._file_lock(Journal.path_for(path))
+        )
+        return journal
+
+    def _attach(self, budget: Budget, journal: Journal, stamp: int):
+        # The stamp is bumped before a change is appended to the journal, so a process which empties the journal
+        # after the record is appended knows it is stale, see `Journal`
+        self._track(budget, stamp)
+        journal.attach(budget)
+
+    def _unload(self, idx: str):
+        self.budgets.pop(idx, None)
+        self._untrack(idx)
+        journal = self.journals.pop(idx, None)
+        if journal is not None:
+            journal.close()
 
     def save_budget(self, budget: Budget):
-        budget.save(self.parent_directory / f"{budget.id}.json")
+        # Budgets are saved in the format they were loaded from
+        path = self.get_budget_path(budget.id)
+        with self._file_lock(Journal.path_for(path)):
+            self._save_budget(budget, path)
+
+    @_synchronized
+    def _save_budget(self, budget: Budget, path: Path):
+        created = budget.id not in self.manifest
+        if budget.id in self.journals:
+            if not self._is_current(budget.id):
+                # The changes of this process are in the journal along with those of the others, so the budget is
+                # loaded again, after which it is current and can be saved
+                budget = self.get_budget(budget.id)
+            budget.save(path)
+            self.journals[budget.id].reset()
+        else:
+            budget.save(path)
+            self._attach(budget, self._create_journal(budget.id, path), self.stamps.get(budget.id))
+        stat = path.stat()
+        self.budgets[budget.id] = budget
+        self.manifest[budget.id] = BudgetInfo(budget.id, budget.name, str(path), stat.st_mtime, stat.st_size)
+        self._write_manifest()
+        if created:
+            self._bump_catalog()
 
     def create_budget(self, name: str) -> Budget:
         budget = Budget(name, id=str(uuid4()))
-        self.budgets[budget.id] = budget
         self.save_budget(budget)
         return budget
 
+    @_synchronized
+    def delete_budget(self, idx: str):
+        self._unload(idx)
+        self.manifest.pop(idx, None)
+        self._bump_catalog()
+
+    @_synchronized
+    def _loaded_budget(self, idx: str) -> Optional[Budget]:
+        budget = self.budgets.get(idx)
+        if budget is not None:
+            if self._is_current(idx):
+                return budget
+            logging.info(f"Loading budget {idx} again, as it was changed by another process")
+            self._unload(idx)
+        return None
+
+    def get_budget(self, idx: str):
+        budget = self._loaded_budget(idx)
+        if budget is not None:
+            return budget
+        # Loaded while holding the lock of the journal, so no other process compacts it between reading the budget
+        # and replaying the journal
+        with self._process_lock(idx):
+            return self._load_budget(idx)
+
+    @_synchronized
+    def _load_budget(self, idx: str) -> Budget:
+        # Another thread may have loaded it in the meantime
+        budget = self._loaded_budget(idx)
+        if budget is not None:
+            return budget
+        info = self._info(idx)
+        # The stamp is read first, so a change made while loading makes the budget stale rather than lost
+        stamp = self.stamps.get(idx)
+        journal = self._create_journal(idx, Path(info.path))
+        budget = self.budgets[idx] = Budget.load(info.path, journal)
+        self._attach(budget, journal, stamp)
+        return budget
+
+    def get_budget_path(self, idx: str) -> Path:
+        try:
+            return Path(self.manifest[idx].path)
+        except KeyError:
+            return self.parent_directory / f"{idx}{self.codec.suffix}"
+
+    def read_budget(self, idx: str) -> dict:
+        """
+        The budget as last saved, as returned by `Budget.to_dict`.
+        """
+        path = self.get_budget_path(idx)
+        return codec_for(path).read(path)
+
+
+class SqliteBudgetRepository(_SharedVersions):
+    """
+    Budgets stored in a SQLite database, see `finance.model.database`. A budget is loaded on the first `get_budget`,
+    after which its changes are written to the database as they happen. Several processes can share the database,
+    see `_SharedVersions`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.budgets: Dict[str, Budget] = {}
+        self.database = BudgetDatabase(path)
+        super().__init__(VersionStamps(path))
+
+    @_synchronized
+    def list_budgets(self) -> List[BudgetInfo]:
+        path = str(self.database.path)
+        return [BudgetInfo(x["id"], x["name"], path, x["modified"]) for x in self.database.list_budgets()]
+
+    @_synchronized
+    def save_budget(self, budget: Budget):
+        # The changes to a loaded budget are already written
+        if self.budgets.get(budget.id) is not budget:
+            # A copy shares the snapshot of the budget it is copied from, which carries the id of that budget
+            self.database.write({**budget._snapshot(), "id": budget.id})
+            self.database.attach(budget)
+            self._track(budget, self.stamps.get(budget.id))
+            self.budgets[budget.id] = budget
+
+    @_synchronized
+    def create_budget(self, name: str) -> Budget:
+        budget = Budget(name, id=str(uuid4()))
+        self.save_budget(budget)
+        return budget
+
+    @_synchronized
     def delete_budget(self, idx: str):
-        if idx in self.budgets:
-            self.budgets.pop(idx)
+        self.budgets.pop(idx, None)
+        self._untrack(idx)
+        self.database.delete(idx)
 
+    @_synchronized
     def get_budget(self, idx: str):
+        budget = self.budgets.get(idx)
+        if budget is not None:
+            if self._is_current(idx):
+                return budget
+            logging.info(f"Loading budget {idx} again, as it was changed by another process")
+            self.database.detach(idx)
+            self._untrack(idx)
+
+        stamp = self.stamps.get(idx)
         try:
-            return self.budgets[idx]
+            budget = Budget.from_dict(self.database.read(idx))
         except KeyError:
+            self.budgets.pop(idx, None)
             raise BudgetNotFoundError()
+        self.database.attach(budget)
+        self._track(budget, stamp)
+        self.budgets[idx] = budget
+        return budget
+
+    def read_budget(self, idx: str) -> dict:
+        return self.database.read(idx)
+
 
-    def get_budget_path(self, idx: str):
-        return self.parent_directory / f"{idx}.json"
+def create_repository():
+    """
+    The repository given by the environment: the SQLite database at BUDGET_DATABASE if it is set, otherwise the
+    directory BUDGET_DIRECTORY with new budgets saved in BUDGET_FORMAT.
+    """
+    database = os.getenv("BUDGET_DATABASE")
+    if database:
+        return SqliteBudgetRepository(database)
+    return BudgetRepository(os.getenv("BUDGET_DIRECTORY", "budgets"), os.getenv("BUDGET_FORMAT", ".json"))
 
 
-repo = BudgetRepository(os.getenv("BUDGET_DIRECTORY", "budgets"))
+repo = create_repository()
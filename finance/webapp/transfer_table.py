@@ -3,16 +3,18 @@ from uuid import uuid4
 
 from dash.exceptions import PreventUpdate
 
-from finance.model.entry import Budget
+from finance.model.entry import Budget, Transfer
 
-from dash_extensions.enrich import html, Input, Output, DashProxy, Trigger, State
+from dash_extensions.enrich import html, Input, Output, DashProxy, State
 from dash_extensions.enrich import dash_table
 
-from finance.webapp.helpers import handle_update, create_add_btn
-from finance.webapp.models import ChangeStoreModel
+from finance.webapp.helpers import apply_rows, create_add_btn, render_cache, skip_unaffected, \
+    edit_budget, rejects_stale_edits
+from finance.webapp.models import ChangeStoreModel, TRANSFERS, ACCOUNTS
 from finance.webapp.state import repo, BudgetNotFoundError
 
 
+@render_cache
 def create_data_table(budget: Budget):
     columns = [
         {'id': 'name', 'name': 'Navn', 'type': 'text'},
@@ -65,31 +67,28 @@ def create_callbacks(app: DashProxy):
         State('selected-budget', 'data'),
         prevent_initial_call=True
     )
+    @rejects_stale_edits
     def update_graphs(data: dict, data_previous: dict, budget_idx: str) -> ChangeStoreModel:
-        try:
-            budget = repo.get_budget(budget_idx)
-        except BudgetNotFoundError:
-            raise PreventUpdate()
-
         if data and data_previous and data != data_previous:
-            handle_update(data_previous, data, budget.transfers, "Transfers")
-
-            return ChangeStoreModel(budget_idx)
+            with edit_budget(budget_idx) as (budget, change):
+                apply_rows(data_previous, data, budget.transfers, Transfer, budget.delete, budget.add_transfer, "Transfers")
+            return change
         else:
             raise PreventUpdate()
 
     @app.callback(
         Output('transfers', 'children'),
         Input('selected-budget', 'data'),
-        Trigger('change-store', 'data')
+        Input('change-store', 'data')
     )
-    def update(budget_idx: str):
+    def update(budget_idx: str, change: ChangeStoreModel):
+        skip_unaffected(change, TRANSFERS, ACCOUNTS)
         try:
-            budget = repo.get_budget(budget_idx)
-            return [
-                create_data_table(budget),
-                create_add_btn("add-transfer")
-            ]
+            with repo.read(budget_idx) as budget:
+                return [
+                    create_data_table(budget),
+                    create_add_btn("add-transfer")
+                ]
         except BudgetNotFoundError:
             raise PreventUpdate()
 
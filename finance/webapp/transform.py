@@ -1,50 +1,146 @@
 import dataclasses
 import inspect
+import typing
+from enum import Enum
 
-from dash_extensions.enrich import DashTransform
-from dataclass_wizard import fromdict, asdict
+from dash_extensions.enrich import DashTransform, Trigger
+
+
+def _camel(name: str) -> str:
+    # The keys are camel case, as written by dataclass_wizard which the stores were first encoded with
+    head, *tail = name.split("_")
+    return head + "".join(x.title() for x in tail)
+
+
+def _identity(x):
+    return x
+
+
+def _field_codec(tp):
+    """
+    The encoder and decoder of a field of the given type.
+    """
+    if dataclasses.is_dataclass(tp):
+        return encoder_for(tp), decoder_for(tp)
+    if isinstance(tp, type) and issubclass(tp, Enum):
+        return (lambda x: x if x is None else x.value), (lambda x: x if x is None else tp(x))
+    return _identity, _identity
+
+
+def _fields(cls) -> list:
+    # The name, key in the dict and codec of each field
+    hints = typing.get_type_hints(cls)
+    return [(f.name, _camel(f.name), f.init, _field_codec(hints[f.name])) for f in dataclasses.fields(cls)]
+
+
+_encoders = {}
+_decoders = {}
+
+
+def encoder_for(cls):
+    """
+    The function encoding instances of the dataclass as dicts, built once per class.
+    """
+    try:
+        return _encoders[cls]
+    except KeyError:
+        pass
+
+    fields = [(name, key, encode) for name, key, _, (encode, _) in _fields(cls)]
+    plain = [(name, key) for name, key, encode in fields if encode is _identity]
+    coded = [(name, key, encode) for name, key, encode in fields if encode is not _identity]
+
+    def encode(obj):
+        result = {key: getattr(obj, name) for name, key in plain}
+        for name, key, encode_field in coded:
+            result[key] = encode_field(getattr(obj, name))
+        return result
+
+    _encoders[cls] = encode
+    return encode
+
+
+def decoder_for(cls):
+    """
+    The function decoding dicts as instances of the dataclass, built once per class. Keys can be camel or snake
+    case, and missing keys take the defaults of the dataclass.
+    """
+    try:
+        return _decoders[cls]
+    except KeyError:
+        pass
+
+    fields = [(name, key, decode) for name, key, init, (_, decode) in _fields(cls) if init]
+
+    def decode(data):
+        if data is None:
+            return None
+        kwargs = {}
+        for name, key, decode_field in fields:
+            if key in data:
+                kwargs[name] = decode_field(data[key])
+            elif name in data:
+                kwargs[name] = decode_field(data[name])
+        return cls(**kwargs)
+
+    _decoders[cls] = decode
+    return decode
+
+
+# The encoder of each type seen as an output, or None for types which are not dataclasses
+_output_encoders = {}
+
+
+def _encode_output(obj):
+    cls = obj.__class__
+    try:
+        encode = _output_encoders[cls]
+    except KeyError:
+        encode = _output_encoders[cls] = encoder_for(cls) if dataclasses.is_dataclass(cls) else None
+    return obj if encode is None else encode(obj)
 
 
 class _DataclassFunctionWrapper:
 
-    def __init__(self, f, multi_output: bool):
+    def __init__(self, f, multi_output: bool, is_trigger: list = ()):
         self.f = f
-        self.full_arg_spec = inspect.getfullargspec(self.f)
         self.multi_output = multi_output
 
-        # Identify the indices of the arguments to be converted
-        self._args_to_covert = {}
-        arg_annotations = self.full_arg_spec.annotations
-        for idx, arg_name in enumerate(self.full_arg_spec.args):
-            try:
-                if dataclasses.is_dataclass(arg_annotations[arg_name]):
-                    self._args_to_covert[idx] = arg_annotations[arg_name]
-            except KeyError:
-                pass
+        # The decoder of each argument to be converted by its position in the call. Triggers are passed on to the
+        # function by Dash but removed before it is called, so they do not count as parameters.
+        signature = inspect.signature(f)
+        hints = inspect.unwrap(f).__annotations__
+        params = [hints.get(x) for x in signature.parameters]
+        positions = [idx for idx in range(len(is_trigger)) if not is_trigger[idx]]
+        positions += range(len(is_trigger), len(is_trigger) + len(params) - len(positions))
+        self._args_to_convert = [
+            (idx, decoder_for(tp)) for idx, tp in zip(positions, params) if dataclasses.is_dataclass(tp)
+        ]
 
-    @staticmethod
-    def _convert_arg(obj):
-        return asdict(obj) if dataclasses.is_dataclass(obj) else obj
+        # The result is only converted when its declared type is a dataclass, or when it is not declared
+        returns = hints.get("return")
+        if returns is None or multi_output:
+            self._convert_result = _encode_output
+        elif dataclasses.is_dataclass(returns):
+            self._convert_result = encoder_for(returns)
+        else:
+            self._convert_result = None
 
     def __call__(self, *args, **kwargs):
 
-        if not self._args_to_covert:
-            result = self.f(*args, **kwargs)
-        else:
-            new_args = []
-
-            for idx in range(len(args)):
-                try:
-                    new_args.append(fromdict(self._args_to_covert[idx], args[idx]))
-                except KeyError:
-                    new_args.append(args[idx])
-            result = self.f(*new_args, **kwargs)
+        if self._args_to_convert:
+            args = list(args)
+            for idx, decode in self._args_to_convert:
+                if idx < len(args):
+                    args[idx] = decode(args[idx])
+        result = self.f(*args, **kwargs)
 
+        if self._convert_result is None:
+            return result
         # Always convert the result if it is a dataclass - also in with multiple outputs
         if self.multi_output:
-            return [self._convert_arg(x) for x in result]
-        else:
-            return self._convert_arg(result)
+            return [_encode_output(x) for x in result]
+        return self._convert_result(result)
 
 
 class DataclassTransform(DashTransform):
@@ -54,6 +150,7 @@ class DataclassTransform(DashTransform):
 
     def apply_serverside(self, callbacks):
         for cb in callbacks:
-            cb.f = _DataclassFunctionWrapper(cb.f, cb.multi_output)
+            is_trigger = [isinstance(x, Trigger) for x in cb.inputs]
+            cb.f = _DataclassFunctionWrapper(cb.f, cb.multi_output, is_trigger)
 
         return callbacks
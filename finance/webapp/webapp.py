@@ -15,6 +15,7 @@ from flask import Flask
 from finance.webapp import expense_income_graph, income_table, transfer_table, \
     balance_summary, \
     movements, accounts_table, movements_graph
+from finance.model.codec import Codec
 from finance.webapp import expense_table
 from finance.webapp import saldo_graph
 from finance.webapp.models import ChangeStoreModel
@@ -45,7 +46,8 @@ app = DashProxy(
 )
 def save_budget(budget_idx: str, dirty: list):
     try:
-        repo.save_budget(repo.get_budget(budget_idx))
+        with repo.write(budget_idx) as budget:
+            repo.save_budget(budget)
         if budget_idx in dirty:
             dirty.remove(budget_idx)
         return dirty
@@ -71,7 +73,8 @@ def show_save(budget_idx: str, dirty: list):
 )
 def mark_dirty(change_store: ChangeStoreModel, dirty: list):
     idx = change_store.budget_idx
-    if idx is not None:
+    # Without scopes the change store only brings the panels up to date, e.g. when another budget is selected
+    if idx is not None and change_store.scopes is not None:
         if idx not in dirty:
             dirty.append(idx)
     return dirty
@@ -85,6 +88,9 @@ def mark_dirty(change_store: ChangeStoreModel, dirty: list):
 )
 def changed(current_state):
     current_state["correlation"] = str(uuid4())
+    # Another budget is shown, so every panel is affected
+    current_state["scopes"] = None
+    current_state["groups"] = []
     return current_state
 
 
@@ -110,11 +116,11 @@ def select_budget(selected_idx: str):
 
     return [
         dmc.NavLink(
-            id=dict(type="select-budget", budget=idx),
-            label=budget.name,
+            id=dict(type="select-budget", budget=info.id),
+            label=info.name,
             icon=DashIconify(icon="bi:house-door-fill", height=16),
-            active=idx == selected_idx
-        ) for idx, budget in repo.budgets.items()
+            active=info.id == selected_idx
+        ) for info in repo.list_budgets()
     ]
 
 
@@ -143,7 +149,8 @@ def modal_demo(selected, budget_name, copy_from):
     t = get_triggered()
     if t.id == "modal-submit-button":
         if copy_from is not None:
-            new_budget = repo.get_budget(copy_from).copy()
+            with repo.read(copy_from) as budget:
+                new_budget = budget.copy()
             repo.save_budget(new_budget)
             idx = new_budget.id
         else:
@@ -161,14 +168,17 @@ def modal_demo(selected, budget_name, copy_from):
     prevent_initial_call=True
 )
 def download(budget_idx):
-    budget = repo.get_budget(budget_idx)
-    budget_path = repo.get_budget_path(budget_idx)
+    try:
+        with repo.read(budget_idx) as budget:
+            name = budget.name
+    except BudgetNotFoundError:
+        raise PreventUpdate()
 
     def to_json(bytes_io: BytesIO):
-        with open(budget_path, "rb") as f:
-            bytes_io.write(f.read())
+        # The budget might be stored in another format, so it is always converted to JSON
+        bytes_io.write(Codec().dumps(repo.read_budget(budget_idx)))
 
-    return dcc.send_bytes(to_json, f"{budget.name}.json")
+    return dcc.send_bytes(to_json, f"{name}.json")
 
 
 app.layout = html.Div([
@@ -229,8 +239,8 @@ app.layout = html.Div([
                                     id="copy-select",
                                     value=None,
                                     data=[
-                                        {"value": idx, "label": budget.name}
-                                        for idx, budget in repo.budgets.items()
+                                        {"value": info.id, "label": info.name}
+                                        for info in repo.list_budgets()
                                     ],
                                 ),
                                 dmc.Space(h=20),
@@ -0,0 +1,8 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# The web app creates its repository when finance.webapp.state is imported, so it gets a directory of its own
+os.environ.setdefault("BUDGET_DIRECTORY", tempfile.mkdtemp())
+atexit.register(shutil.rmtree, os.environ["BUDGET_DIRECTORY"], ignore_errors=True)
@@ -0,0 +1,120 @@
+import pytest
+
+from finance.model.entry import EntryGroup, Entry
+from finance.webapp.expense_table import create_data_table_data, create_row
+from finance.webapp.helpers import apply_rows, EditConflictError
+
+
+def create_group() -> EntryGroup:
+    group = EntryGroup("Housing")
+    group.add_entry(Entry("Rent", 100, account="Spending"))
+    group.add_entry(Entry("Water", 30, payment_period=3, first_payment_month=2, account="Spending"))
+    group.add_entry(Entry("Heating", 60, payment_period=12, first_payment_month=10, account="Bills"))
+    return group
+
+
+def apply(group: EntryGroup, old: list, new: list):
+    apply_rows(old, new, group.entries, Entry, group.delete_entry, group.add_entry, group.name, create_row)
+
+
+def test_edit_of_reordered_rows():
+    group = create_group()
+    old = create_data_table_data(group)[::-1]
+    new = [dict(x) for x in old]
+    new[0]["payment_size"] = 80
+
+    apply(group, old, new)
+
+    assert [x.payment_size for x in group.entries] == [100, 30, 80]
+
+
+def test_paste_into_several_rows():
+    group = create_group()
+    old = create_data_table_data(group)
+    new = [dict(x, account="Savings", payment_fee="2.5") for x in old]
+
+    apply(group, old, new)
+
+    assert [x.account for x in group.entries] == ["Savings"] * 3
+    assert [x.payment_fee for x in group.entries] == [2.5] * 3
+
+
+def test_deleted_and_added_rows():
+    group = create_group()
+    old = create_data_table_data(group)
+    new = old[1:] + [{"name": "Internet", "payment_size": "25"}]
+
+    apply(group, old, new)
+
+    assert [x.name for x in group.entries] == ["Water", "Heating", "Internet"]
+    assert group.entries[-1].payment_size == 25.0
+
+
+def test_invalid_values_are_ignored():
+    group = create_group()
+    old = create_data_table_data(group)
+    new = [dict(x) for x in old]
+    new[0].update(payment_size="a lot", payment_period="6", monthly="1000")
+
+    apply(group, old, new)
+
+    entry = group.entries[0]
+    assert (entry.payment_size, entry.payment_period) == (100, 6)
+
+
+def test_edit_of_a_cell_changed_by_someone_else():
+    group = create_group()
+    old = create_data_table_data(group)
+    group.entries[0].payment_size = 120
+    new = [dict(x) for x in old]
+    new[0]["payment_size"] = 110
+    new[1]["payment_size"] = 40
+
+    with pytest.raises(EditConflictError):
+        apply(group, old, new)
+    assert [x.payment_size for x in group.entries] == [120, 30, 60]
+
+
+def test_edit_of_other_cells_and_rows_than_someone_else():
+    group = create_group()
+    old = create_data_table_data(group)
+    group.entries[0].payment_size = 120
+    group.add_entry(Entry("Internet", 25))
+    new = [dict(x) for x in old]
+    new[0]["name"] = "House rent"
+    new[1]["payment_size"] = 40
+
+    apply(group, old, new)
+
+    assert [(x.name, x.payment_size) for x in group.entries] == [
+        ("House rent", 120), ("Water", 40), ("Heating", 60), ("Internet", 25)
+    ]
+
+
+def test_due_month_of_a_monthly_entry():
+    # The table shows the due month of a monthly entry as 0
+    group = create_group()
+    old = create_data_table_data(group)
+    new = [dict(x) for x in old]
+    new[0].update(payment_period=3, first_payment_month=2)
+
+    apply(group, old, new)
+
+    assert (group.entries[0].payment_period, group.entries[0].first_payment_month) == (3, 2)
+
+
+def test_edit_of_a_row_deleted_by_someone_else():
+    group = create_group()
+    old = create_data_table_data(group)
+    group.delete_entry(group.entries[1])
+    new = [dict(x) for x in old]
+    new[1]["payment_size"] = 40
+
+    with pytest.raises(EditConflictError):
+        apply(group, old, new)
+    assert [x.name for x in group.entries] == ["Rent", "Heating"]
+
+    new = [dict(x) for x in old]
+    new[0]["payment_size"] = 110
+    apply(group, old, new)
+    assert [(x.name, x.payment_size) for x in group.entries] == [("Rent", 110), ("Heating", 60)]
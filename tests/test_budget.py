@@ -0,0 +1,75 @@
+import threading
+
+from finance.model.entry import Budget, EntryGroup, Entry, Account, AccountType
+
+
+def create_budget() -> Budget:
+    budget = Budget("Budget")
+    entry_group = EntryGroup("Housing")
+    budget.add_expense_group(entry_group)
+    entry_group.add_entry(Entry("Rent", 100, account="Spending"))
+    return budget
+
+
+def test_frame_is_current_during_batch():
+    budget = create_budget()
+    entry = budget.expenses[0].entries[0]
+    assert budget.frame.total_monthly() == 100
+
+    with budget.batch():
+        entry.payment_size = 200
+        assert budget.frame.total_monthly() == 200
+
+    assert budget.frame.total_monthly() == 200
+
+
+def test_copy_does_not_share_extra():
+    budget = create_budget()
+    budget.add_account(Account("Spending", "", AccountType.Spending))
+    budget.add_extra("account-layout", {"Spending": {"x": 1, "y": 2}})
+
+    copy = budget.copy()
+    copy.accounts[0].name = "Daily"
+
+    assert copy.extra["account-layout"] == {"Daily": {"x": 1, "y": 2}}
+    assert budget.extra["account-layout"] == {"Spending": {"x": 1, "y": 2}}
+    assert budget.copy().extra["account-layout"] == {"Spending": {"x": 1, "y": 2}}
+
+
+def test_copy_is_materialized_on_first_read():
+    budget = create_budget()
+    copy = budget.copy()
+    with copy.batch():
+        copy.name = "Copy"
+    assert "_cow_snapshot" in copy.__dict__
+
+    assert copy.total_monthly() == 100
+    assert copy.expenses[0]._parent is copy
+    assert "_cow_snapshot" not in copy.__dict__
+
+
+def test_copy_is_materialized_once_by_concurrent_readers():
+    budget = create_budget()
+    for i in range(200):
+        budget.expenses[0].add_entry(Entry(f"Entry {i}", 1))
+    errors = []
+
+    for _ in range(10):
+        copy = budget.copy()
+        barrier = threading.Barrier(4)
+
+        def read():
+            barrier.wait()
+            try:
+                assert copy.total_monthly() == 300
+                assert len(copy.expenses[0].entries) == 201
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
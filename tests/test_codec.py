@@ -0,0 +1,17 @@
+import pytest
+
+from finance.model import codec
+from finance.model.codec import JsonFormat
+from finance.model.entry import Budget, EntryGroup, Entry
+
+
+def test_json_is_written_the_same_without_orjson(monkeypatch):
+    pytest.importorskip("orjson")
+    budget = Budget("Budget")
+    budget.add_expense_group(EntryGroup("Bolig"))
+    budget.expenses[0].add_entry(Entry("Husleje", 8500.5, account="Fælles"))
+    data = budget.to_dict()
+    written = JsonFormat().dumps(data)
+
+    monkeypatch.setattr(codec, "orjson", None)
+    assert JsonFormat().dumps(data) == written
@@ -0,0 +1,55 @@
+from finance.model.diff import diff, apply
+from finance.model.entry import Budget, EntryGroup, Entry, Transfer, Account, AccountType
+
+
+def create_budget() -> Budget:
+    budget = Budget("Budget")
+    for name in ("Spending", "Savings", "Bills"):
+        budget.add_account(Account(name, "", AccountType.Spending))
+    for name in ("Housing", "Transport"):
+        group = EntryGroup(name)
+        budget.add_expense_group(group)
+        for i in range(3):
+            group.add_entry(Entry(f"{name} {i}", 10 * (i + 1), account="Spending" if i else "Bills"))
+    budget.add_transfer(Transfer("Savings", "Spending", "Savings", 100))
+    budget.add_transfer(Transfer("Bills", "Spending", "Bills", 50))
+    return budget
+
+
+def assert_applies(old: Budget, new: Budget):
+    target = old.copy()
+    target.id = old.id
+    apply(target, diff(old, new))
+    assert {**target.to_dict(), "id": new.id} == new.to_dict()
+
+
+def test_order_is_kept():
+    old = create_budget()
+    new = old.copy()
+    group = new.expenses[0]
+    entry = group.entries[0]
+    group.delete_entry(entry)
+    group.add_entry(entry)
+    transfer = new.transfers[0]
+    new.delete(transfer)
+    new.add_transfer(transfer)
+    new.delete(new.expenses[0])
+    new.add_expense_group(group)
+
+    changes = diff(old, new)
+    assert changes.moved
+    assert_applies(old, new)
+
+
+def test_swapped_account_names():
+    old = create_budget()
+    new = old.copy()
+    spending, savings = new.accounts[0], new.accounts[1]
+    spending.name = "Temporary"
+    savings.name = "Spending"
+    spending.name = "Savings"
+    assert [x.source for x in new.transfers] == ["Savings", "Savings"]
+
+    # Only the accounts are renamed, everything else follows
+    assert all(x["name"] == "name" for x in diff(old, new))
+    assert_applies(old, new)
@@ -0,0 +1,74 @@
+import threading
+
+from finance.model.entry import Budget, EntryGroup, Entry
+from finance.model.journal import Journal
+from finance.utils.locks import FileLock
+
+
+def create_budget(path) -> Budget:
+    budget = Budget("Budget")
+    budget.add_expense_group(EntryGroup("Housing"))
+    budget.save(path)
+    return budget
+
+
+def test_append_after_cut_off_record(tmp_path):
+    path = tmp_path / "budget.json"
+    budget = create_budget(path)
+    journal = Journal(Journal.path_for(path))
+    journal.attach(budget)
+    budget.expenses[0].add_entry(Entry("Rent", 100))
+    journal.close()
+
+    # The process died while writing a record
+    with open(Journal.path_for(path), "ab") as f:
+        f.write(b'{"op": "set", "id": ')
+
+    budget = Budget.load(str(path))
+    journal = Journal(Journal.path_for(path))
+    journal.attach(budget)
+    budget.expenses[0].add_entry(Entry("Water", 20))
+    journal.close()
+
+    loaded = Budget.load(str(path))
+    assert [x.name for x in loaded.expenses[0].entries] == ["Rent", "Water"]
+
+
+def test_compact_keeps_budget_file(tmp_path):
+    path = tmp_path / "budget.json"
+    budget = create_budget(path)
+    saved = path.read_bytes()
+    journal = Journal(Journal.path_for(path), budget_path=path, compact_after=2)
+    journal.attach(budget)
+    for i in range(3):
+        budget.expenses[0].add_entry(Entry(f"Entry {i}", 10))
+    journal.close()
+
+    assert path.read_bytes() == saved
+    assert Journal.snapshot_for(path).exists()
+    assert len(Budget.load(str(path)).expenses[0].entries) == 3
+
+    journal = Journal(Journal.path_for(path), budget_path=path)
+    loaded = Budget.load(str(path), journal)
+    assert journal.records == 1
+    loaded.save(path)
+    journal.reset()
+    assert not Journal.snapshot_for(path).exists()
+    assert len(Budget.load(str(path)).expenses[0].entries) == 3
+
+
+def test_compact_waits_for_other_writers(tmp_path):
+    path = tmp_path / "budget.json"
+    budget = create_budget(path)
+    journal = Journal(Journal.path_for(path), budget_path=path)
+    journal.attach(budget)
+
+    # Another process holds the lock of the journal while it edits the budget
+    other = FileLock(Journal.path_for(path))
+    with other:
+        thread = threading.Thread(target=journal.compact)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+    assert Journal.snapshot_for(path).exists()
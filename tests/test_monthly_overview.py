@@ -0,0 +1,93 @@
+import numpy as np
+
+from finance.model.entry import Budget, EntryGroup, Entry
+from finance.utils.monthly_overview import monthly, expected_saldos
+
+
+def create_budget() -> Budget:
+    budget = Budget("Budget")
+    entry_group = EntryGroup("Housing")
+    budget.add_expense_group(entry_group)
+    entry_group.add_entry(Entry("Rent", 100, account="Spending"))
+    return budget
+
+
+def test_monthly_after_edit_in_batch():
+    budget = create_budget()
+    entry = budget.expenses[0].entries[0]
+    assert list(monthly(budget, "Spending")[0]) == [100] * 12
+
+    with budget.batch():
+        entry.payment_size = 200
+        assert list(monthly(budget, "Spending")[0]) == [200] * 12
+        entry.payment_fee = 50
+
+    assert list(monthly(budget, "Spending")[0]) == [250] * 12
+
+
+def test_batch_bumps_version_once_more():
+    budget = create_budget()
+    with budget.batch():
+        budget.expenses[0].entries[0].payment_size = 200
+        version = budget.version
+    assert budget.version != version
+
+    version = budget.version
+    with budget.batch():
+        pass
+    assert budget.version == version
+
+
+def _expected_saldo_loop(monthly_expenses):
+    # expected_saldo as it was before it was batched
+    n = len(monthly_expenses)
+
+    saldo = np.zeros(n)
+    avg_expense = np.average(monthly_expenses)
+
+    pivot = np.argmax(monthly_expenses)
+
+    for x in range(n):
+        idx = (x + pivot) % n
+        if monthly_expenses[(x + pivot) % n] < avg_expense:
+            break
+        else:
+            pivot = idx
+
+    for i in range(1, n):
+        idx = (i + pivot) % n
+        saldo[idx] = saldo[idx - 1] - monthly_expenses[idx] + avg_expense
+
+    return saldo
+
+
+def test_expected_saldos_match_the_loop():
+    rng = np.random.default_rng(0)
+    rows = [
+        # Random amounts, some of them recurring, so the largest expense and the average can have ties
+        *rng.integers(0, 5, size=(500, 12)) * 100.0,
+        *rng.uniform(0, 1000, size=(500, 12)),
+        np.zeros(12),
+        np.full(12, 250.0),
+        np.array([500.0] * 6 + [100.0] * 6),
+        np.array([100.0, 500.0] * 6),
+        np.array([0.0] * 11 + [1200.0]),
+        np.array([1200.0] + [0.0] * 11),
+    ]
+    monthly_expenses = np.array(rows)
+
+    saldo, buffer = expected_saldos(monthly_expenses)
+
+    for row, result, row_buffer in zip(monthly_expenses, saldo, buffer):
+        expected = _expected_saldo_loop(row)
+        assert np.array_equal(result, expected)
+        assert row_buffer == max(0.0, -expected.min())
+
+
+def test_expected_saldos_of_other_lengths():
+    rng = np.random.default_rng(1)
+    for n in (1, 2, 4, 6, 24):
+        monthly_expenses = rng.integers(0, 4, size=(50, n)) * 100.0
+        saldo, _ = expected_saldos(monthly_expenses)
+        for row, result in zip(monthly_expenses, saldo):
+            assert np.array_equal(result, _expected_saldo_loop(row))
@@ -0,0 +1,31 @@
+import pytest
+
+from finance.model.entry import Budget, EntryGroup, Entry, Transfer, Account, AccountType
+from finance.utils.simulation import simulate
+
+
+def create_budget() -> Budget:
+    budget = Budget("Budget")
+    entry_group = EntryGroup("Housing")
+    budget.add_expense_group(entry_group)
+    entry_group.add_entry(Entry("Rent", 100, account="Spending"))
+    return budget
+
+
+@pytest.mark.parametrize("trials, chunk_size", [(0, 5000), (-1, 5000), (10, 0)])
+def test_invalid_trials_and_chunk_size(trials, chunk_size):
+    with pytest.raises(ValueError, match="trials" if trials < 1 else "chunk_size"):
+        simulate(create_budget(), {}, trials=trials, chunk_size=chunk_size)
+
+
+def test_accounts_without_payments():
+    budget = Budget("Budget")
+    for name in ("Spending", "Savings"):
+        budget.add_account(Account(name, "", AccountType.Spending))
+    budget.add_transfer(Transfer("Savings", "Spending", "Savings", 100))
+
+    result = simulate(budget, {}, trials=3, chunk_size=2)
+
+    assert result.trials == 3
+    assert list(result.start_balances) == [1200, 0]
+    assert list(result.probability_negative) == [0, 0]